@@ -10,6 +10,13 @@ import os
 import sys
 from pathlib import Path
 
+from scan_cli import run_scanner
+from scan_content import SNIFF_SIZE, SummaryWriter, looks_binary
+from scan_engine import FLAG_SKIP_IF_BINARY, FileManifest, ScanSettings, TreeBudget, walk_project
+from scan_incremental import (PreviousSummary, code_stamp, load_fingerprint, project_fingerprint,
+                              save_fingerprint, save_manifest)
+from scan_jobs import UP_TO_DATE, needs_file_sizes, render_contents
+
 # --- Configuration ---
 SCRIPT_DIR = Path(__file__).parent.resolve()
 REPO_ROOT = SCRIPT_DIR.parent
@@ -69,26 +76,6 @@ IGNORE_DIRS_ROOT = {
 # --- End Configuration ---
 
 
-def is_binary_file(file_path):
-    """Check if a file is binary or text."""
-    # Check extension first
-    file_ext = os.path.splitext(file_path)[1].lower()
-    if file_ext in BINARY_EXTENSIONS:
-        return True
-    
-    # If no extension or not a known binary extension,
-    # try reading first bytes to detect if it's binary
-    try:
-        with open(file_path, 'rb') as f:
-            # Read first 1024 bytes
-            chunk = f.read(1024)
-            # Check for null bytes or control characters uncommon in text files
-            return b'\x00' in chunk or sum(1 for b in chunk if b < 9 and b != 0) > 0
-    except Exception:
-        # In case of error, assume binary to avoid issues
-        return True
-
-
 def should_include_content(file_path, root_dir, code_extensions, include_root_files, 
                           ignore_content_files, ignore_content_extensions):
     """Check if file content should be included in output."""
@@ -103,10 +90,10 @@ def should_include_content(file_path, root_dir, code_extensions, include_root_fi
     if file_ext in ignore_content_extensions:
         return False
         
-    # 1.5. DO NOT include if file is binary (no extension or unknown extension)
-    if file_ext == '' or file_ext not in code_extensions:
-        if is_binary_file(file_path):
-            return False
+    # 1.5. DO NOT include if file has a known binary extension (files without
+    # extension or with an unknown one are sniffed when their content is read)
+    if file_ext not in code_extensions and file_ext in BINARY_EXTENSIONS:
+        return False
 
     # 2. Include if it's a specifically named file in root (and not ignored above)
     if is_in_root and filename in include_root_files:
@@ -123,74 +110,133 @@ def should_include_content(file_path, root_dir, code_extensions, include_root_fi
     if effective_ext in code_extensions:
         return True
         
-    # 4. Include files without extension if NOT binary (already checked above)
+    # 4. Include files without extension (if NOT binary, see needs_binary_sniff)
     if file_ext == '':
         return True
 
     return False
 
 
-def write_project_structure(start_path, root_dir, target_subdir, output_file, 
-                           code_files_list, indent_level=0, process_children=False):
-    """Recursively write structure and collect code files."""
-    try:
-        listed_items = sorted(os.listdir(start_path))
-    except OSError as e:
-        print(f"Warning: Could not read directory {start_path}: {e}", file=sys.stderr)
-        return
-
-    is_root_level = (start_path == root_dir)
-    items_to_process = []
-
-    # Filter ignored items BEFORE processing
-    for item in listed_items:
-        item_path = os.path.join(start_path, item)
-        is_dir = os.path.isdir(item_path)
-
-        # Ignore directories defined in IGNORE_DIRS_ROOT at root level
-        if is_root_level and is_dir and item in IGNORE_DIRS_ROOT:
-            continue
-
-        items_to_process.append(item)
-
-    # Process remaining items
-    for item in items_to_process:
-        item_path = os.path.join(start_path, item)
-        prefix = INDENT_STRING * indent_level
-        is_dir = os.path.isdir(item_path)
-
-        if is_dir:
-            # If at root AND this is the target directory (e.g., 'package')
-            if is_root_level and item == target_subdir:
-                output_file.write(f"{prefix}- {item}/\n")
-                write_project_structure(item_path, root_dir, target_subdir, output_file, 
-                                      code_files_list, indent_level + 1, process_children=True)
-            # If at root, but NOT the target directory
-            elif is_root_level:
-                output_file.write(f"{prefix}- {item}/ [...ignored]\n")
-            # If already processing children (inside target directory)
-            elif process_children:
-                output_file.write(f"{prefix}- {item}/\n")
-                write_project_structure(item_path, root_dir, target_subdir, output_file, 
-                                      code_files_list, indent_level + 1, process_children=True)
-        else:  # It's a file
-            output_file.write(f"{prefix}- {item}\n")
-            # If processing children (inside target directory) OR file is at root
-            if process_children or is_root_level:
-                # Check if this file's content should be included
-                if should_include_content(item_path, root_dir, CODE_EXTENSIONS, 
-                                        INCLUDE_ROOT_FILES_BY_NAME, IGNORE_CONTENT_FILES, 
-                                        IGNORE_CONTENT_EXTENSIONS):
-                    code_files_list.append(item_path)
-
-
-def process_project(project_dir, output_filename, target_subdir=None):
-    """Process a single project directory."""
+def needs_binary_sniff(filename, code_extensions):
+    """Check if an included file must be dropped when its content turns out to be binary."""
+    file_ext = os.path.splitext(filename)[1].lower()
+    return file_ext == '' or file_ext not in code_extensions
+
+
+def is_ignored_entry(name, is_dir, depth):
+    """Check if a listed item should be left out of the structure entirely."""
+    # Ignore directories defined in IGNORE_DIRS_ROOT at root level
+    return depth == 0 and is_dir and name in IGNORE_DIRS_ROOT
+
+
+def walk_project_tree(root_dir, target_subdir, settings, announce=True):
+    """Walk the part of a project its summary lists."""
+    def descend(name, depth):
+        # At root only the target directory (e.g., 'package') is walked,
+        # below it everything is
+        return depth > 0 or name == target_subdir
+
+    return walk_project(root_dir, ignore=is_ignored_entry, descend=descend, settings=settings, announce=announce)
+
+
+def fingerprint_project(records, target_subdir, settings):
+    """Fingerprint everything the summary of a project is built from (its walk records), without reading any file."""
+    # Editing this script or the scan_* modules it renders with changes the fingerprint too
+    config = {'code': code_stamp(__file__), 'target': target_subdir, 'options': settings.output_options()}
+    return project_fingerprint(records, config)
+
+
+def write_project_structure(root_dir, target_subdir, output_file, code_files_list, indent_level=0,
+                            settings=None, records=None):
+    """Write structure and collect code files from a single walk of the project (records, if already walked)."""
+    if settings is None:
+        settings = ScanSettings()
+
+    # Directories over the entry budget collapse into aggregate lines
+    budget = TreeBudget(settings.tree_max_entries)
+    if records is None:
+        records = walk_project_tree(root_dir, target_subdir, settings)
+    for record in records:
+        for depth, summary in budget.collapsed_before(record.depth):
+            output_file.write(f"{INDENT_STRING * (indent_level + depth)}- {summary}\n")
+        visible = budget.admit(record)
+        prefix = INDENT_STRING * (indent_level + record.depth)
+
+        if record.is_dir:
+            if not visible:
+                continue
+            # Already walked under another path (symlink loop, bind mount)
+            if record.revisit:
+                output_file.write(f"{prefix}- {record.name}/ [...already listed]\n")
+            elif record.descend:
+                output_file.write(f"{prefix}- {record.name}/\n")
+            # At root, but NOT the target directory
+            else:
+                output_file.write(f"{prefix}- {record.name}/ [...ignored]\n")
+        else:  # It's a file (at root or inside the target directory)
+            if visible:
+                output_file.write(f"{prefix}- {record.name}\n")
+            # Check if this file's content should be included
+            if should_include_content(record.path, root_dir, CODE_EXTENSIONS, 
+                                    INCLUDE_ROOT_FILES_BY_NAME, IGNORE_CONTENT_FILES, 
+                                    IGNORE_CONTENT_EXTENSIONS):
+                # Files without a code extension are only kept if they turn out to be text
+                flags = FLAG_SKIP_IF_BINARY if needs_binary_sniff(record.name, CODE_EXTENSIONS) else 0
+                code_files_list.add(record, flags)
+
+    for depth, summary in budget.collapsed_at_end():
+        output_file.write(f"{INDENT_STRING * (indent_level + depth)}- {summary}\n")
+
+
+def write_binary_placeholder(outfile, relative_path, opened, flags, verdicts):
+    """
+    Content check for write_file_contents: a binary file gets a placeholder
+    section, or none if it was only kept in case it was text. Returns False
+    for text files, whose content is rendered.
+    """
+    # Open once: the sniff buffer is reused as the start of the content.
+    # Files that cannot be read are treated as binary.
+    binary = opened.binary
+    if not binary and opened.error is None and looks_binary(opened.head[:SNIFF_SIZE], opened.encoding):
+        binary = True
+        if verdicts is not None:
+            verdicts.record_binary(opened.stat)
+    if not binary and opened.error is None:
+        return False
+    if not flags & FLAG_SKIP_IF_BINARY:
+        outfile.write_header(relative_path)
+        outfile.write("*** BINARY FILE - CONTENT NOT DISPLAYED ***\n")
+        outfile.write_footer(relative_path)
+    return True
+
+
+def process_project(project_dir, output_filename, target_subdir=None, settings=None):
+    """
+    Process a single project directory.
+
+    With settings.skip_unchanged, returns UP_TO_DATE without writing anything
+    when the project's fingerprint matches the one saved with its summary.
+    """
     if target_subdir is None:
         target_subdir = DEFAULT_TARGET_SUBDIR
+    if settings is None:
+        settings = ScanSettings()
 
     project_name = os.path.basename(project_dir)
-    code_files_to_read = []
+
+    # With SCAN_SKIP_UNCHANGED the walk is fingerprinted first (in the project's worker, with --jobs):
+    # an unchanged project is not rendered, a changed one lists the same records in its summary
+    records = None
+    fingerprint = None
+    if settings.skip_unchanged:
+        records = list(walk_project_tree(project_dir, target_subdir, settings))
+        fingerprint = fingerprint_project(records, target_subdir, settings)
+        if fingerprint == load_fingerprint(output_filename):
+            print(f"Up to date, skipped: {project_name}")
+            return UP_TO_DATE
+
+    # File sizes (a stat each) are only collected to weight content shards
+    code_files_to_read = FileManifest(project_dir, track_sizes=needs_file_sizes(settings))
 
     print(f"Processing: {project_name}")
     print(f"  Output file: {output_filename}")
@@ -202,8 +248,12 @@ def process_project(project_dir, output_filename, target_subdir=None):
     print(f"  Directories ignored at root: {', '.join(IGNORE_DIRS_ROOT)}")
     print(f"  Files without extension will be checked for binary nature")
 
+    # With SCAN_INCREMENTAL, sections of unchanged files are copied from the previous summary,
+    # which stays in place until the new one is complete
+    previous = PreviousSummary.load(output_filename, settings) if settings.incremental else None
+
     try:
-        with open(output_filename, 'w', encoding='utf-8') as outfile:
+        with SummaryWriter(output_filename, settings.output_buffer, atomic=settings.incremental) as outfile:
             # --- Part 1: File Structure ---
             outfile.write("=" * 30 + "\n")
             outfile.write(" Project Structure\n")
@@ -214,41 +264,25 @@ def process_project(project_dir, output_filename, target_subdir=None):
             outfile.write(f"(Binary files are ignored)\n\n")
             outfile.write(f"- {project_name}/ (root)\n")
 
-            write_project_structure(project_dir, project_dir, target_subdir, outfile, 
-                                  code_files_to_read, indent_level=1, process_children=False)
+            write_project_structure(project_dir, target_subdir, outfile, code_files_to_read, indent_level=1,
+                                    settings=settings, records=records)
 
             # --- Part 2: File Contents ---
             outfile.write("\n\n" + "="*30 + "\n")
             outfile.write(" Relevant File Contents\n")
             outfile.write("="*30 + "\n\n")
 
-            code_files_to_read.sort()
-
-            for file_path in code_files_to_read:
-                relative_path = os.path.relpath(file_path, project_dir).replace('\\', '/')
-                try:
-                    if is_binary_file(file_path):
-                        outfile.write(f"--- File: {relative_path} ---\n\n")
-                        outfile.write("*** BINARY FILE - CONTENT NOT DISPLAYED ***\n")
-                        outfile.write("\n\n" + "="*15 + f" End of {relative_path} " + "="*15 + "\n\n")
-                        continue
-                        
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as infile:
-                        content = infile.read()
-                        # Optional: Skip files that are empty after reading
-                        if not content.strip() and os.path.getsize(file_path) == 0:
-                            continue
-
-                        outfile.write(f"--- File: {relative_path} ---\n\n")
-                        outfile.write(content)
-                        # Add clear separator between files
-                        outfile.write("\n\n" + "="*15 + f" End of {relative_path} " + "="*15 + "\n\n")
-
-                except Exception as e:
-                    outfile.write(f"--- File: {relative_path} ---\n\n")
-                    outfile.write(f"*** Error reading file: {e} ***\n")
-                    outfile.write("\n\n" + "="*15 + f" End of {relative_path} (with error) " + "="*15 + "\n\n")
-
+            # Rendered serially, or in shards by worker processes with SCAN_RENDER_WORKERS
+            # Binary files get a placeholder; files found binary on earlier runs are not opened again
+            sections = render_contents(outfile, code_files_to_read, settings, previous,
+                                       check=write_binary_placeholder, binary_verdicts=True)
+
+        if sections is not None:
+            save_manifest(output_filename, sections, settings)
+            print(f"  Incremental: {sections.reused} of {len(sections.sections)} sections reused "
+                  f"from the previous summary")
+        if fingerprint is not None:
+            save_fingerprint(output_filename, fingerprint)
         print(f"  ✓ Successfully generated '{output_filename}'!")
         return True
 
@@ -260,56 +294,22 @@ def process_project(project_dir, output_filename, target_subdir=None):
         return False
 
 
-def main():
+def main(argv=None):
     """Main function to process all projects in input directory."""
-    # Get directories from environment or use defaults
-    input_dir = Path(os.environ.get('INPUT_DIR', DEFAULT_INPUT_DIR))
-    output_dir = Path(os.environ.get('OUTPUT_DIR', DEFAULT_OUTPUT_DIR))
-    
     # Get target subdirectory from environment or use default
     target_subdir = os.environ.get('TARGET_SUBDIR', DEFAULT_TARGET_SUBDIR)
 
-    print("=" * 60)
-    print("PROJECT SUMMARY GENERATOR - BUILD PROJECTS")
-    print("=" * 60)
-    print(f"Input directory: {input_dir}")
-    print(f"Output directory: {output_dir}")
-    print(f"Target subdirectory: {target_subdir}")
-    print("=" * 60)
-    print()
-
-    # Ensure directories exist
-    if not input_dir.exists():
-        print(f"Error: Input directory not found: {input_dir}", file=sys.stderr)
-        print("Please create it and add projects to scan.", file=sys.stderr)
-        return 1
-
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # Find all project directories in input
-    projects = [d for d in input_dir.iterdir() if d.is_dir()]
-    
-    if not projects:
-        print(f"Warning: No project directories found in {input_dir}", file=sys.stderr)
-        print("Please add project directories to scan.", file=sys.stderr)
-        return 1
-
-    success_count = 0
-    for project_path in sorted(projects):
-        project_name = project_path.name
-        output_filename = output_dir / f"{project_name}_build_summary.txt"
-        
-        print(f"\n[Project: {project_name}]")
-        if process_project(str(project_path), str(output_filename), target_subdir):
-            success_count += 1
-        print()
-
-    print("=" * 60)
-    print(f"COMPLETED! Processed {success_count}/{len(projects)} projects")
-    print(f"Output files in: {output_dir}")
-    print("=" * 60)
-    
-    return 0 if success_count > 0 else 1
+    # Options, settings, skipping and dispatch are shared by every scanner (see scan_cli)
+    return run_scanner(__doc__.strip().splitlines()[0],
+                       banner="PROJECT SUMMARY GENERATOR - BUILD PROJECTS",
+                       target=target_subdir,
+                       target_line=f"Target subdirectory: {target_subdir}",
+                       summary_suffix="_build_summary.txt",
+                       process_project=process_project,
+                       walk_project_tree=walk_project_tree,
+                       default_input_dir=DEFAULT_INPUT_DIR,
+                       default_output_dir=DEFAULT_OUTPUT_DIR,
+                       argv=argv)
 
 
 if __name__ == "__main__":
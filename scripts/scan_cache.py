@@ -0,0 +1,236 @@
+"""
+Persistent Caches Shared Across Projects and Runs
+
+Content-addressed cache of rendered file sections:
+
+Forks and branches of one codebase hold many identical files. With
+SCAN_RENDER_CACHE set to a directory, the rendered body of a file section
+(the decoded, possibly line-numbered content between its header and footer)
+is stored there under a key made of the file's content digest and the
+rendering options. Every scanner, project and run sharing the directory
+reuses a stored body instead of decoding the file again.
+
+Entries are plain files, written to a temporary name and renamed into place,
+so concurrent processes never see a partial entry. A hit refreshes the
+entry's mtime; once the cache grows over its size limit the least recently
+used entries are evicted by mtime.
+
+Binary verdicts: with SCAN_BINARY_CACHE set to a file, the build scanner
+records there the files its sniff found binary, by (device, inode, size,
+mtime) and encoding detection mode (UTF-16/UTF-32 text is only text when
+encodings are detected). A file still matching a recorded identity is known
+to be binary without being opened. The file is an append-only log of one
+identity per line, written with single O_APPEND writes, so concurrent
+processes can add verdicts without locking; it is rewritten without the
+superseded lines once those outnumber the current ones.
+"""
+
+import hashlib
+import json
+import os
+
+from scan_content import MMAP_THRESHOLD, SummaryWriter, copy_range
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+# Eviction goes down to this fraction of the limit, so it does not run on every store
+TRIM_TARGET = 0.9
+
+# Verdict logs shorter than this are never compacted
+VERDICT_COMPACT_MIN_LINES = 256
+
+# Open caches of this process, by (directory, size limit) and by verdict file
+_caches = {}
+_verdicts = {}
+
+
+def open_render_cache(directory, size_limit=DEFAULT_CACHE_SIZE):
+    """Return the RenderCache of this process for directory, creating it on first use."""
+    cache = _caches.get((directory, size_limit))
+    if cache is None:
+        cache = _caches[(directory, size_limit)] = RenderCache(directory, size_limit)
+    return cache
+
+
+class RenderCache:
+    """An on-disk cache of rendered section bodies, capped at size_limit bytes."""
+
+    def __init__(self, directory, size_limit=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.size_limit = size_limit
+        # Bytes in the cache as seen by this process, counted on the first store
+        self.usage = None
+
+    def entry_path(self, digest, options):
+        """Return the path of the entry for a content digest rendered with options."""
+        key = hashlib.blake2b(digest_size=16)
+        key.update(json.dumps([CACHE_VERSION, digest, options, os.linesep], sort_keys=True).encode('utf-8'))
+        name = key.hexdigest()
+        return os.path.join(self.directory, name[:2], name)
+
+    def write_section(self, outfile, digest, options, render):
+        """
+        Write the body of a section to outfile from the entry for digest and
+        options. On a miss, render(writer) renders the body into a new entry
+        first.
+        """
+        path = self.entry_path(digest, options)
+        if self._copy_entry(outfile, path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with SummaryWriter(path, atomic=True) as writer:
+            render(writer)
+            size = writer.tell()
+        if not self._copy_entry(outfile, path):
+            raise OSError(f"Render cache entry vanished: {path}")
+        self._account(size)
+
+    def _copy_entry(self, outfile, path):
+        try:
+            entry = open(path, 'rb')
+        except FileNotFoundError:
+            return False
+        with entry:
+            size = os.fstat(entry.fileno()).st_size
+            # Small entries go through the output buffer, large ones are copied in the kernel
+            if size < MMAP_THRESHOLD:
+                outfile.write_bytes(entry.read())
+            else:
+                copy_range(entry, outfile, 0, size)
+        return True
+
+    def _entries(self):
+        """Return (mtime_ns, size, path) for every entry, skipping temporary files."""
+        entries = []
+        try:
+            buckets = [bucket.path for bucket in os.scandir(self.directory) if bucket.is_dir()]
+        except OSError:
+            return entries
+        for bucket in buckets:
+            try:
+                with os.scandir(bucket) as listing:
+                    for entry in listing:
+                        if entry.name.startswith('.'):
+                            continue
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            except OSError:
+                continue
+        return entries
+
+    def _account(self, size):
+        if self.usage is None:
+            self.usage = sum(entry_size for _mtime, entry_size, _path in self._entries())
+        else:
+            self.usage += size
+        if self.usage > self.size_limit:
+            self.trim()
+
+    def trim(self):
+        """Evict the least recently used entries until the cache is under its size limit."""
+        entries = self._entries()
+        entries.sort()
+        usage = sum(size for _mtime, size, _path in entries)
+        target = self.size_limit * TRIM_TARGET
+        for _mtime, size, path in entries:
+            if usage <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            usage -= size
+        self.usage = usage
+
+
+def open_binary_verdicts(path, detect_encoding=True):
+    """Return the BinaryVerdicts of this process for path and detection mode, creating it on first use."""
+    verdicts = _verdicts.get((path, detect_encoding))
+    if verdicts is None:
+        verdicts = _verdicts[(path, detect_encoding)] = BinaryVerdicts(path, detect_encoding)
+    return verdicts
+
+
+def _format_verdict(key):
+    return '%d %d %d %d %d\n' % key
+
+
+class BinaryVerdicts:
+    """
+    The set of file identities found binary, persisted in an append-only file
+    shared by both encoding detection modes.
+    """
+
+    def __init__(self, path, detect_encoding=True):
+        self.path = path
+        self.mode = 1 if detect_encoding else 0
+        # Loaded on first use
+        self._binary = None
+
+    def _key(self, stat):
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, self.mode)
+
+    def _load(self):
+        # Latest verdict of each (device, inode, mode): older ones are superseded
+        latest = {}
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='ascii') as f:
+                for line in f:
+                    lines += 1
+                    fields = line.split()
+                    # A line cut short by a crash (or from an older format) is ignored
+                    if len(fields) != 5 or not all(field.lstrip('-').isdigit() for field in fields):
+                        continue
+                    key = tuple(int(field) for field in fields)
+                    file_id = (key[0], key[1], key[4])
+                    if file_id not in latest or latest[file_id][3] <= key[3]:
+                        latest[file_id] = key
+        except (OSError, ValueError):
+            pass
+        if lines >= VERDICT_COMPACT_MIN_LINES and lines > 2 * len(latest):
+            self._compact(latest.values())
+        self._binary = set(latest.values())
+        return self._binary
+
+    def _compact(self, keys):
+        """Rewrite the log with only the current verdicts (appends racing with this are lost, not wrong)."""
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='ascii') as f:
+                f.writelines(_format_verdict(key) for key in keys)
+            os.replace(temp_path, self.path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def is_binary(self, stat):
+        """Check whether a file, by its stat, was found binary before in this detection mode."""
+        binary = self._binary if self._binary is not None else self._load()
+        return self._key(stat) in binary
+
+    def record_binary(self, stat):
+        """Remember that the file with this stat is binary in this detection mode."""
+        binary = self._binary if self._binary is not None else self._load()
+        key = self._key(stat)
+        if key in binary:
+            return
+        binary.add(key)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, _format_verdict(key).encode('ascii'))
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
@@ -0,0 +1,122 @@
+"""
+Command Line Driver Shared by the Project Summary Generators
+
+Every scanner summarises each project directory of INPUT_DIR into OUTPUT_DIR
+the same way: --jobs, --watch and --poll-interval on the command line, engine
+settings from the SCAN_* variables, one memory budget for the run, projects
+dispatched with run_projects and the up to date ones (SCAN_SKIP_UNCHANGED,
+checked by process_project itself, in its worker) counted apart.
+run_scanner() does all of it; a scanner's main() only resolves its target
+and describes itself.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from scan_engine import ScanSettings, describe_memory_use
+from scan_jobs import UP_TO_DATE, resolve_jobs, run_projects
+from scan_watch import watch_projects, watched_directories
+
+
+def parse_arguments(description, argv=None):
+    """Parse the command line options shared by the scanners."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="projects processed in parallel worker processes (0: one per CPU)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and regenerate summaries as project files change")
+    parser.add_argument('--poll-interval', type=float, default=0.0, metavar='SECONDS',
+                        help="with --watch, poll for changes every SECONDS instead of using inotify")
+    return parser.parse_args(argv)
+
+
+def run_scanner(description, banner, target, target_line, summary_suffix, process_project,
+                walk_project_tree, default_input_dir, default_output_dir, argv=None):
+    """
+    Summarise every project of the input directory; return the exit status.
+
+    target is what the scanner walks deeply, passed on as the third argument
+    of process_project(project_dir, output_filename, target, settings) and
+    walk_project_tree(project_dir, target, settings, announce). banner and
+    target_line describe the scanner in the header of the run; summaries are
+    named <project><summary_suffix>.
+    """
+    args = parse_arguments(description, argv)
+    jobs = resolve_jobs(args.jobs)
+
+    # Get directories from environment or use defaults
+    input_dir = Path(os.environ.get('INPUT_DIR', default_input_dir))
+    output_dir = Path(os.environ.get('OUTPUT_DIR', default_output_dir))
+
+    # Get engine settings (SCAN_* variables) from environment
+    try:
+        settings = ScanSettings.from_environ()
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.watch:
+        # Regenerating a project only renders the files that changed
+        settings.incremental = not settings.dedup_links
+    # One memory budget for the whole run, shared with every worker process
+    memory_budget = settings.install_memory_budget()
+
+    print("=" * 60)
+    print(banner)
+    print("=" * 60)
+    print(f"Input directory: {input_dir}")
+    print(f"Output directory: {output_dir}")
+    print(target_line)
+    for line in settings.describe():
+        print(line)
+    print(f"Parallel projects: {jobs if jobs > 1 else 'serial'}")
+    print("=" * 60)
+    print()
+
+    # Ensure directories exist
+    if not input_dir.exists():
+        print(f"Error: Input directory not found: {input_dir}", file=sys.stderr)
+        print("Please create it and add projects to scan.", file=sys.stderr)
+        return 1
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Find all project directories in input
+    projects = [d for d in input_dir.iterdir() if d.is_dir()]
+
+    if not projects:
+        print(f"Warning: No project directories found in {input_dir}", file=sys.stderr)
+        print("Please add project directories to scan.", file=sys.stderr)
+        return 1
+
+    def walk_listed(project_dir):
+        # The part of a project its summary lists, for cost estimates and --watch
+        return walk_project_tree(project_dir, target, settings, announce=False)
+
+    project_runs = []
+    for project_path in sorted(projects):
+        output_filename = output_dir / f"{project_path.name}{summary_suffix}"
+        project_runs.append((project_path.name, (str(project_path), str(output_filename), target, settings)))
+
+    # Projects are independent: with --jobs they run in worker processes, logs printed per project in order
+    results = run_projects(process_project, project_runs, jobs, walk_listed)
+    success_count = sum(1 for result in results if result)
+    up_to_date = results.count(UP_TO_DATE)
+
+    print("=" * 60)
+    print(f"COMPLETED! Processed {success_count}/{len(projects)} projects")
+    if settings.skip_unchanged:
+        print(f"Up to date (skipped): {up_to_date}")
+    print(f"Output files in: {output_dir}")
+    if memory_budget is not None:
+        print(describe_memory_use(memory_budget))
+    print("=" * 60)
+
+    if args.watch:
+        def list_directories(project_dir):
+            return watched_directories(project_dir, walk_listed(project_dir))
+
+        return watch_projects(process_project, project_runs, list_directories, jobs, args.poll_interval)
+
+    return 0 if success_count > 0 else 1
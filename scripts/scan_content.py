@@ -0,0 +1,610 @@
+"""
+Content Helpers for the Project Summary Generators
+
+Each included file is opened once: the first bytes read for the binary sniff
+(or the whole file, when small) are kept and become the start of the content,
+so no file is opened or stat'ed again to be emitted. Content is then copied to
+the output in bounded chunks through an incremental decoder, so memory use
+does not grow with file size.
+
+Each file's encoding is detected once from those first bytes (byte order
+marks, UTF-8 validity, then cp1252/latin-1), and its decoder built once.
+Files that are already plain UTF-8 skip decoding entirely: their bytes are
+written as-is, and large ones are spliced into the output by the kernel.
+Files above a size threshold are memory-mapped, so validation, decoding and
+writing work on slices of the mapping instead of buffered copies.
+
+With reader threads enabled, files are opened and read ahead of the writer by
+prefetch(), within a byte budget, and still written in manifest order.
+
+copy_numbered renders content with line numbers in the format of the Bash
+scanner, numbering whole chunks at a time.
+
+Summaries are written through SummaryWriter, which collects text and raw bytes
+in one large buffer, emits section headers and footers from prebuilt bytes
+templates and flushes in big writes aligned to OUTPUT_ALIGNMENT.
+"""
+
+import codecs
+import hashlib
+import io
+import mmap
+import operator
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from scan_memory import current_budget
+
+# Line prefix of the numbered rendering, as printed by nl -ba -w4 -s' │ '
+LINE_NUMBER_FORMAT = '{:4d} │ '.format
+
+# Bytes read up front to decide whether a file is binary
+SNIFF_SIZE = 1024
+
+# Default size of the chunks content is copied in
+CHUNK_SIZE = 1024 * 1024
+
+# Default size from which files are memory-mapped instead of read
+MMAP_THRESHOLD = 256 * 1024
+
+# Default bound on the bytes and files read ahead of the writer by reader threads
+PREFETCH_BUDGET = 64 * 1024 * 1024
+PREFETCH_MAX_FILES = 256
+
+# Default output buffer size; flushes write multiples of OUTPUT_ALIGNMENT bytes
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+OUTPUT_ALIGNMENT = 64 * 1024
+
+# Raw bytes can only stand in for decoded text when the output does not
+# translate '\n' into another line separator
+PASSTHROUGH_SUPPORTED = os.linesep == '\n'
+
+# Elsewhere (macOS, FreeBSD) os.sendfile only writes to sockets
+_SENDFILE_TO_FILES = sys.platform.startswith('linux')
+
+# Every byte value that may appear in text; deleting these from a sniff buffer
+# leaves only null bytes and control characters uncommon in text files
+_TEXT_BYTES = bytes(range(9, 256))
+
+# Byte order marks, UTF-32 first as its little-endian mark starts like UTF-16's
+_BYTE_ORDER_MARKS = ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+                     (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+# Bytes with no character in cp1252
+_CP1252_UNDEFINED = bytes([0x81, 0x8D, 0x8F, 0x90, 0x9D])
+
+_END = object()
+
+
+def looks_binary(chunk, encoding=None):
+    """
+    Check a sniff buffer for null bytes or control characters uncommon in text
+    files. Text detected as UTF-16/UTF-32 is never binary.
+    """
+    if is_wide_encoding(encoding):
+        return False
+    return bool(chunk.translate(None, _TEXT_BYTES))
+
+
+class OpenedFile:
+    """
+    An included file opened ahead of being copied: the open binary file, its
+    stat size and the bytes already read from it, or the error met doing so.
+    """
+
+    __slots__ = ('infile', 'size', 'head', 'error', 'encoding', 'stat', 'digest', 'reused', 'binary')
+
+    def __init__(self, infile=None, size=0, head=b'', error=None, encoding=None, stat=None, digest=None,
+                 reused=None, binary=False):
+        self.infile = infile
+        self.size = size
+        self.head = head
+        self.error = error
+        self.encoding = encoding
+        self.stat = stat
+        self.digest = digest
+        # Section of the previous summary standing for this file, when it is unchanged
+        self.reused = reused
+        # Known to be binary from a BinaryVerdicts cache, so it was not opened
+        self.binary = binary
+
+    def take(self):
+        """Return the open file, raising the error met while opening it instead if any."""
+        if self.error is not None:
+            raise self.error
+        return self.infile
+
+    def close(self):
+        if self.infile is not None:
+            self.infile.close()
+
+
+def content_digest(file_path, head=b'', size=0):
+    """
+    Return the hex digest identifying a file's content. head may hold the
+    whole content already read (when len(head) == size).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if len(head) == size:
+        digest.update(head)
+    else:
+        with open(file_path, 'rb') as infile:
+            while True:
+                chunk = infile.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_content(file_path, whole_file_limit=0, detect=False, digest=False, max_size=0):
+    """
+    Open a file, stat it and read its first bytes, for copy_content.
+
+    Files of at most whole_file_limit bytes, which copy_content reads whole
+    anyway, are read completely; from others only SNIFF_SIZE bytes are read
+    and the kernel is asked to start reading the rest. Errors are stored in
+    the result rather than raised, so this can run on a reader thread.
+    With detect, the encoding is picked by detect_encoding from the first
+    SNIFF_SIZE bytes whatever the file size; with digest, the content_digest
+    of the file is computed as well. Files over max_size bytes (if not 0) are
+    closed without reading anything: only their size and stat are returned.
+    """
+    try:
+        infile = open(file_path, 'rb')
+    except OSError as e:
+        return OpenedFile(error=e)
+    try:
+        stat = os.fstat(infile.fileno())
+        size = stat.st_size
+        if max_size and size > max_size:
+            infile.close()
+            return OpenedFile(size=size, stat=stat)
+        if size <= whole_file_limit:
+            head = infile.read()
+        else:
+            head = infile.read(SNIFF_SIZE)
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(infile.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        file_digest = content_digest(file_path, head, size) if digest else None
+    except OSError as e:
+        infile.close()
+        return OpenedFile(error=e)
+    # Detected from the sniff buffer only, so the verdict does not depend on how much was read
+    encoding = detect_encoding(head[:SNIFF_SIZE]) if detect else None
+    return OpenedFile(infile, size, head, encoding=encoding, stat=stat, digest=file_digest)
+
+
+def prefetch(items, load, cost, workers=0, byte_budget=PREFETCH_BUDGET, max_pending=PREFETCH_MAX_FILES):
+    """
+    Yield (item, load(item)) for each item, strictly in order.
+
+    With workers > 1, a thread pool runs load() on upcoming items while the
+    caller (the single writer) consumes earlier ones. Items are admitted while
+    the cost(item) of the loaded-but-unconsumed items fits in byte_budget and
+    fewer than max_pending are outstanding; the next item is always admitted,
+    however large. With workers <= 1 each item is loaded when it is reached.
+
+    Every item also reserves its cost from the process's memory budget, if
+    any, until the caller moves on to the next item. Lookahead items are only
+    admitted while the budget has room; with nothing loaded ahead, the writer
+    waits for memory.
+    """
+    memory = current_budget()
+    if workers <= 1:
+        for item in items:
+            item_cost = cost(item)
+            if memory is not None:
+                memory.acquire(item_cost)
+            try:
+                yield item, load(item)
+            finally:
+                if memory is not None:
+                    memory.release(item_cost)
+        return
+
+    pending = deque()
+    pending_cost = 0
+    consumed_cost = 0
+    iterator = iter(items)
+    upcoming = next(iterator, _END)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                if memory is not None and consumed_cost:
+                    memory.release(consumed_cost)
+                consumed_cost = 0
+                while upcoming is not _END and len(pending) < max_pending:
+                    upcoming_cost = cost(upcoming)
+                    if pending and pending_cost + upcoming_cost > byte_budget:
+                        break
+                    if memory is not None and not memory.acquire(upcoming_cost, block=not pending):
+                        break
+                    pending.append((upcoming, upcoming_cost, executor.submit(load, upcoming)))
+                    pending_cost += upcoming_cost
+                    upcoming = next(iterator, _END)
+                if not pending:
+                    return
+                item, consumed_cost, future = pending.popleft()
+                pending_cost -= consumed_cost
+                yield item, future.result()
+    finally:
+        if memory is not None:
+            memory.release(consumed_cost + pending_cost)
+
+
+def _template(text):
+    """Encode a section template once, with the platform line separator."""
+    return text.replace('\n', os.linesep).encode('utf-8')
+
+
+SECTION_HEADER = _template("--- File: %s ---\n\n")
+SECTION_FOOTER = _template("\n\n" + "=" * 15 + " End of %s " + "=" * 15 + "\n\n")
+ERROR_SECTION_FOOTER = _template("\n\n" + "=" * 15 + " End of %s (with error) " + "=" * 15 + "\n\n")
+
+
+class SummaryWriter:
+    """
+    Output sink for a summary file.
+
+    Text is encoded to UTF-8 (with newlines translated like a text-mode file)
+    and raw bytes are appended to the same buffer, which is written out in
+    multiples of OUTPUT_ALIGNMENT once it holds buffer_size bytes (reserved
+    from the memory budget, if any, down to OUTPUT_ALIGNMENT).
+    """
+
+    def __init__(self, filename, buffer_size=OUTPUT_BUFFER_SIZE, atomic=False):
+        self.name = filename
+        # An atomic writer fills a temporary file that replaces filename on a clean close
+        self.temp_name = None
+        if atomic:
+            directory, name = os.path.split(os.path.abspath(filename))
+            self.temp_name = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+            self.raw = open(self.temp_name, 'wb', buffering=0)
+        else:
+            self.raw = open(filename, 'wb', buffering=0)
+        self.buffer = bytearray()
+        # Under a memory budget the buffer gets what is left of it
+        self.memory = current_budget()
+        self.reserved = 0
+        if self.memory is not None:
+            self.reserved = self.memory.acquire_up_to(buffer_size)
+            buffer_size = self.reserved
+        self.buffer_size = max(buffer_size, OUTPUT_ALIGNMENT)
+        self.translate_newlines = os.linesep != '\n'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(discard=exc_type is not None)
+
+    def write(self, text):
+        """Write text."""
+        if self.translate_newlines:
+            text = text.replace('\n', os.linesep)
+        self.write_bytes(text.encode('utf-8'))
+
+    def write_bytes(self, data):
+        """Write raw bytes (any bytes-like object)."""
+        self.buffer += data
+        if len(self.buffer) >= self.buffer_size:
+            self._drain(len(self.buffer) - len(self.buffer) % OUTPUT_ALIGNMENT)
+
+    def write_header(self, relative_path):
+        """Write the header opening the section of a file."""
+        self.write_bytes(SECTION_HEADER % relative_path.encode('utf-8'))
+
+    def write_footer(self, relative_path, template=SECTION_FOOTER):
+        """Write the footer closing the section of a file."""
+        self.write_bytes(template % relative_path.encode('utf-8'))
+
+    def _drain(self, count):
+        view = memoryview(self.buffer)
+        written = 0
+        try:
+            while written < count:
+                written += self.raw.write(view[written:count])
+        finally:
+            view.release()
+        del self.buffer[:count]
+
+    def flush(self):
+        """Write out everything buffered, e.g. before splicing into the file descriptor."""
+        self._drain(len(self.buffer))
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def tell(self):
+        """Return the number of bytes written so far, buffered ones included."""
+        return self.raw.tell() + len(self.buffer)
+
+    def close(self, discard=False):
+        """Flush and close; an atomic writer replaces its file, or is dropped if discard is set."""
+        discard = discard and self.temp_name is not None
+        try:
+            if not discard:
+                self.flush()
+        finally:
+            self.raw.close()
+            if self.reserved:
+                self.memory.release_granted(self.reserved)
+                self.reserved = 0
+        if self.temp_name is not None:
+            if discard:
+                os.remove(self.temp_name)
+            else:
+                os.replace(self.temp_name, self.name)
+            self.temp_name = None
+
+
+def detect_encoding(head):
+    """
+    Pick the encoding of a file from its first bytes.
+
+    A UTF-32/UTF-16 byte order mark wins; ASCII-range text with every other
+    byte null is BOM-less UTF-16. Otherwise the bytes are UTF-8 if they decode
+    as such (a sequence cut at the end of head is allowed), else cp1252, or
+    latin-1 if they hold bytes cp1252 leaves undefined.
+    """
+    for bom, encoding in _BYTE_ORDER_MARKS:
+        if head.startswith(bom):
+            return encoding
+    if len(head) >= 4:
+        even_nuls = head[0::2].count(0)
+        odd_nuls = head[1::2].count(0)
+        if not even_nuls and odd_nuls * 4 > len(head):
+            return 'utf-16-le'
+        if not odd_nuls and even_nuls * 4 > len(head):
+            return 'utf-16-be'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if len(head.translate(None, _CP1252_UNDEFINED)) < len(head):
+        return 'latin-1'
+    return 'cp1252'
+
+
+def is_wide_encoding(encoding):
+    """Check for UTF-16/UTF-32, whose text is full of null bytes."""
+    return encoding is not None and encoding.startswith(('utf-16', 'utf-32'))
+
+
+def text_decoder(encoding=None, translate=True):
+    """
+    Return an incremental decoder for text in encoding, with newlines
+    translated like text mode unless translate is false.
+
+    encoding=None reads bytes the way open(..., encoding='utf-8', errors='ignore')
+    does. A detected encoding replaces undecodable bytes with U+FFFD instead of
+    dropping them.
+    """
+    if encoding is None:
+        decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+    else:
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+    if not translate:
+        return decoder
+    return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+
+def copy_text(infile, outfile, head=b'', chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    Copy a binary file to a SummaryWriter as decoded text, in chunks of at most chunk_size bytes.
+
+    head holds bytes already read from infile (e.g. the sniff buffer). Split
+    UTF-8 sequences and CR LF pairs are carried over between chunks, so the
+    result is the same as reading the whole file in text mode.
+    """
+    decoder = text_decoder(encoding)
+    if head:
+        outfile.write(decoder.decode(head))
+    while True:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            break
+        outfile.write(decoder.decode(chunk))
+    outfile.write(decoder.decode(b'', final=True))
+
+
+def _number_lines(lines, first):
+    """Prefix lines with their numbers, first being the number of lines[0], and join them."""
+    prefixes = map(LINE_NUMBER_FORMAT, range(first, first + len(lines)))
+    return '\n'.join(map(operator.add, prefixes, lines)) + '\n'
+
+
+def copy_numbered(infile, outfile, head=b'', chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    Copy a binary file to a SummaryWriter with numbered lines, as
+    tr -d '\\r' < file | nl -ba -w4 -s' │ ' does in scan_project.sh.
+
+    Each chunk is decoded, stripped of CRs and numbered at once, the prefixes
+    being joined to the lines with map() rather than a Python loop. The
+    unterminated last line of a chunk is carried over to the next one.
+    """
+    decoder = text_decoder(encoding, translate=False)
+    number = 1
+    partial = []
+    chunk = head or infile.read(chunk_size)
+    while True:
+        final = not chunk
+        text = decoder.decode(chunk, final).replace('\r', '')
+        if '\n' in text or final:
+            partial.append(text)
+            lines = ''.join(partial).split('\n')
+            partial = [lines.pop()]
+            if final and partial[0]:
+                lines.append(partial[0])
+            if lines:
+                outfile.write(_number_lines(lines, number))
+                number += len(lines)
+        elif text:
+            partial.append(text)
+        if final:
+            return
+        chunk = infile.read(chunk_size)
+
+
+def _is_plain_utf8(chunk, decoder, final=False):
+    """Check that a chunk is strict UTF-8 (continuing decoder's state) with no CR to translate."""
+    if b'\r' in chunk:
+        return False
+    try:
+        decoder.decode(chunk, final)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _splice(infile, outfile, count, start=0):
+    """Copy count bytes of infile from offset start to the current end of outfile, in the kernel if possible."""
+    in_fd = infile.fileno()
+    out_fd = outfile.fileno()
+    offset = start
+    end = start + count
+    use_copy_file_range = hasattr(os, 'copy_file_range')
+    use_sendfile = _SENDFILE_TO_FILES and hasattr(os, 'sendfile')
+    while offset < end and (use_copy_file_range or use_sendfile):
+        remaining = end - offset
+        try:
+            if use_copy_file_range:
+                copied = os.copy_file_range(in_fd, out_fd, remaining, offset)
+            else:
+                copied = os.sendfile(out_fd, in_fd, offset, remaining)
+        except OSError:
+            # Failing before the first byte means the primitive does not apply
+            # to these descriptors: try the next one
+            if offset > start:
+                raise
+            if use_copy_file_range:
+                use_copy_file_range = False
+            else:
+                use_sendfile = False
+            continue
+        if copied == 0:
+            # Short kernel copy: the user-space loop finishes the range, or stops at EOF
+            break
+        offset += copied
+
+    # No kernel primitive available (or it stopped short): copy what is left through user space
+    infile.seek(offset)
+    while offset < end:
+        chunk = infile.read(min(CHUNK_SIZE, end - offset))
+        if not chunk:
+            break
+        outfile.write_bytes(chunk)
+        offset += len(chunk)
+
+
+def copy_range(infile, outfile, start, count):
+    """Append count bytes of an open binary file, from offset start, to a SummaryWriter."""
+    outfile.flush()
+    _splice(infile, outfile, count, start)
+
+
+def append_file(outfile, file_path):
+    """Append the whole content of a file to a SummaryWriter, copied in the kernel if possible."""
+    outfile.flush()
+    with open(file_path, 'rb') as infile:
+        _splice(infile, outfile, os.fstat(infile.fileno()).st_size)
+
+
+def _map_file(infile):
+    """Map an open file read-only, or return None if it cannot be mapped."""
+    try:
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+def _copy_mapped(mapped, infile, outfile, chunk_size, passthrough, encoding):
+    """copy_content for a memory-mapped file, working on memoryview slices of the mapping."""
+    length = len(mapped)
+    view = memoryview(mapped)
+    try:
+        plain = passthrough and PASSTHROUGH_SUPPORTED and mapped.find(b'\r') == -1
+        if plain:
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for start in range(0, length, chunk_size):
+                if not _is_plain_utf8(view[start:start + chunk_size], decoder):
+                    plain = False
+                    break
+            else:
+                plain = _is_plain_utf8(b'', decoder, final=True)
+
+        if plain and length > chunk_size:
+            outfile.flush()
+            _splice(infile, outfile, length)
+        elif plain:
+            outfile.write_bytes(view)
+        else:
+            decoder = text_decoder(encoding)
+            for start in range(0, length, chunk_size):
+                outfile.write(decoder.decode(view[start:start + chunk_size]))
+            outfile.write(decoder.decode(b'', final=True))
+    finally:
+        view.release()
+
+
+def copy_content(infile, outfile, size, head=b'', chunk_size=CHUNK_SIZE, passthrough=True,
+                 mmap_threshold=MMAP_THRESHOLD, encoding=None, numbered=False):
+    """
+    Copy an open binary file to a SummaryWriter.
+
+    Content that is valid UTF-8 without CRs is already exactly what the text
+    path would write, so it is passed through as raw bytes: files up to
+    chunk_size straight from the bytes read to validate them, larger ones
+    spliced with os.copy_file_range/os.sendfile after a validation pass. Only
+    files that need lossy decoding or newline translation go through copy_text.
+
+    Files of mmap_threshold bytes or more (0 disables this) are mapped and
+    processed from the mapping; head is then ignored, as the mapping covers it.
+
+    encoding is the decoder to use (see text_decoder); only UTF-8 content is
+    passed through. numbered renders the lines with copy_numbered instead.
+    """
+    if numbered:
+        copy_numbered(infile, outfile, head, chunk_size, encoding)
+        return
+    passthrough = passthrough and encoding in (None, 'utf-8')
+    if mmap_threshold and size >= mmap_threshold:
+        mapped = _map_file(infile)
+        if mapped is not None:
+            with mapped:
+                _copy_mapped(mapped, infile, outfile, chunk_size, passthrough, encoding)
+            return
+
+    if not (passthrough and PASSTHROUGH_SUPPORTED):
+        copy_text(infile, outfile, head, chunk_size, encoding)
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if size <= chunk_size:
+        data = head + infile.read()
+        if _is_plain_utf8(data, decoder, final=True):
+            outfile.write_bytes(data)
+        else:
+            outfile.write(text_decoder(encoding).decode(data, final=True))
+        return
+
+    count = len(head)
+    plain = _is_plain_utf8(head, decoder)
+    while plain:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            plain = _is_plain_utf8(b'', decoder, final=True)
+            break
+        count += len(chunk)
+        plain = _is_plain_utf8(chunk, decoder)
+
+    if plain:
+        outfile.flush()
+        _splice(infile, outfile, count)
+    else:
+        infile.seek(0)
+        copy_text(infile, outfile, chunk_size=chunk_size, encoding=encoding)
@@ -0,0 +1,759 @@
+"""
+Shared Traversal Engine for the Project Summary Generators
+
+Directory listings are read with os.scandir so the entry type cached on each
+DirEntry (and its stat result, once fetched) is reused instead of issuing a
+separate os.path.isdir call for every item of every directory.
+
+walk_tree() drives the traversal with an explicit stack and yields one compact
+WalkEntry per listed item in sorted pre-order, so the tree renderer and the
+content collector consume a single stream regardless of how deep the project is.
+Directories are identified by (st_dev, st_ino), so symlink cycles and trees
+mounted more than once are only walked the first time they are reached.
+"""
+
+import os
+import sys
+from array import array
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from scan_cache import DEFAULT_CACHE_SIZE, open_binary_verdicts, open_render_cache
+from scan_content import (CHUNK_SIZE, ERROR_SECTION_FOOTER, MMAP_THRESHOLD, OUTPUT_BUFFER_SIZE,
+                          PREFETCH_BUDGET, SNIFF_SIZE, OpenedFile, SummaryWriter, copy_content,
+                          open_content, prefetch)
+from scan_gitignore import IgnoreChain
+from scan_gitindex import IndexEntry, read_tracked_files
+from scan_incremental import SectionRecorder, stat_matches
+from scan_memory import MemoryBudget, install_budget
+
+# One listed item of the walk. 'depth' is 0 for direct children of the root,
+# 'descend' tells whether the walk will continue into this directory and
+# 'revisit' marks a directory already walked under another path (symlink loop,
+# bind mount), which is therefore not descended again.
+WalkEntry = namedtuple('WalkEntry', ['depth', 'name', 'path', 'is_dir', 'descend', 'entry', 'revisit'])
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+BYTE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class ScanSettings:
+    """Engine tuning shared by the scanners, read from SCAN_* environment variables."""
+
+    def __init__(self, workers=0, gitignore=False, source='fs', dedup_links=False,
+                 tree_max_entries=0, chunk_size=CHUNK_SIZE, passthrough=True,
+                 mmap_threshold=MMAP_THRESHOLD, output_buffer=OUTPUT_BUFFER_SIZE, readers=0,
+                 prefetch_budget=PREFETCH_BUDGET, detect_encoding=True, line_numbers=False,
+                 render_workers=0, memory_budget=0, incremental=False, skip_unchanged=False,
+                 render_cache='', render_cache_size=DEFAULT_CACHE_SIZE, binary_cache=''):
+        self.workers = workers
+        self.gitignore = gitignore
+        self.source = source
+        self.dedup_links = dedup_links
+        self.tree_max_entries = tree_max_entries
+        self.chunk_size = chunk_size
+        self.passthrough = passthrough
+        self.mmap_threshold = mmap_threshold
+        self.output_buffer = output_buffer
+        self.readers = readers
+        self.prefetch_budget = prefetch_budget
+        self.detect_encoding = detect_encoding
+        self.line_numbers = line_numbers
+        self.render_workers = render_workers
+        self.memory_budget = memory_budget
+        # Sections referencing earlier files cannot be reused on their own
+        self.incremental = incremental and not dedup_links
+        self.skip_unchanged = skip_unchanged
+        self.render_cache = render_cache
+        self.render_cache_size = render_cache_size
+        self.binary_cache = binary_cache
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """Build settings from the environment (os.environ by default); raises ValueError on a malformed byte count."""
+        if environ is None:
+            environ = os.environ
+        return cls(
+            workers=int(environ.get('SCAN_WORKERS', '0')),
+            gitignore=environ.get('SCAN_GITIGNORE', '').lower() in TRUE_VALUES,
+            source=environ.get('SCAN_SOURCE', 'fs').lower(),
+            dedup_links=environ.get('SCAN_DEDUP_LINKS', '').lower() in TRUE_VALUES,
+            tree_max_entries=int(environ.get('SCAN_TREE_MAX_ENTRIES', '0')),
+            chunk_size=environ_bytes(environ, 'SCAN_CHUNK_SIZE', CHUNK_SIZE, positive=True),
+            passthrough=environ.get('SCAN_PASSTHROUGH', '1').lower() in TRUE_VALUES,
+            mmap_threshold=environ_bytes(environ, 'SCAN_MMAP_THRESHOLD', MMAP_THRESHOLD),
+            output_buffer=environ_bytes(environ, 'SCAN_OUTPUT_BUFFER', OUTPUT_BUFFER_SIZE, positive=True),
+            readers=int(environ.get('SCAN_READERS', '0')),
+            prefetch_budget=environ_bytes(environ, 'SCAN_PREFETCH_BUDGET', PREFETCH_BUDGET, positive=True),
+            detect_encoding=environ.get('SCAN_DETECT_ENCODING', '1').lower() in TRUE_VALUES,
+            line_numbers=environ.get('SCAN_LINE_NUMBERS', '').lower() in TRUE_VALUES,
+            render_workers=int(environ.get('SCAN_RENDER_WORKERS', '0')),
+            memory_budget=environ_bytes(environ, 'SCAN_MEMORY_BUDGET', 0),
+            incremental=environ.get('SCAN_INCREMENTAL', '').lower() in TRUE_VALUES,
+            skip_unchanged=environ.get('SCAN_SKIP_UNCHANGED', '').lower() in TRUE_VALUES,
+            render_cache=environ.get('SCAN_RENDER_CACHE', ''),
+            render_cache_size=environ_bytes(environ, 'SCAN_RENDER_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+            binary_cache=environ.get('SCAN_BINARY_CACHE', ''),
+        )
+
+    def describe(self):
+        """Return the lines describing these settings for the run banner."""
+        return [
+            f"Directory listing workers: {self.workers if self.workers > 1 else 'serial'}",
+            f"Honour .gitignore: {'yes' if self.gitignore else 'no'}",
+            f"Project source: {'git index (filesystem if not a checkout)' if self.source == 'git' else 'filesystem'}",
+            f"Linked files emitted once: {'yes' if self.dedup_links else 'no'}",
+            f"Tree entries per directory: {self.tree_max_entries or 'unlimited'}",
+            f"Content chunk size: {format_bytes(self.chunk_size)}",
+            f"Plain UTF-8 passthrough: {'yes' if self.passthrough else 'no'}",
+            f"Memory-map files from: {format_bytes(self.mmap_threshold) if self.mmap_threshold else 'never'}",
+            f"Output buffer: {format_bytes(self.output_buffer)}",
+            (f"Content reader threads: {self.readers} (read-ahead budget {format_bytes(self.prefetch_budget)})"
+             if self.readers > 1 else "Content reader threads: none (read on demand)"),
+            f"Detect file encodings: {'yes' if self.detect_encoding else 'no (UTF-8, undecodable bytes dropped)'}",
+            f"Line numbers: {'yes' if self.line_numbers else 'no'}",
+            f"Content rendering processes: {self.render_workers if self.render_workers > 1 else 'serial'}",
+            f"Memory budget: {format_bytes(self.memory_budget) if self.memory_budget else 'unlimited'}",
+            f"Incremental rescans: {'yes' if self.incremental else 'no'}",
+            f"Skip unchanged projects: {'yes' if self.skip_unchanged else 'no'}",
+            (f"Render cache: {self.render_cache} (up to {format_bytes(self.render_cache_size)})"
+             if self.render_cache else "Render cache: none"),
+            f"Binary verdict cache: {self.binary_cache or 'none'}",
+        ]
+
+    def section_options(self):
+        """The settings changing how a file section is rendered, which a reused section must share."""
+        return {'detect_encoding': self.detect_encoding, 'line_numbers': self.line_numbers}
+
+    def output_options(self):
+        """The settings changing what a summary contains, which a skipped project must share."""
+        return dict(self.section_options(), gitignore=self.gitignore, source=self.source,
+                    dedup_links=self.dedup_links, tree_max_entries=self.tree_max_entries)
+
+    def open_render_cache(self):
+        """Return the RenderCache of this process, or None when there is no cache directory."""
+        if not self.render_cache:
+            return None
+        return open_render_cache(self.render_cache, self.render_cache_size)
+
+    def open_binary_verdicts(self):
+        """Return the BinaryVerdicts of this process, or None when there is no verdict cache file."""
+        if not self.binary_cache:
+            return None
+        return open_binary_verdicts(self.binary_cache, self.detect_encoding)
+
+    def install_memory_budget(self):
+        """
+        Create the MemoryBudget of a run and install it in this process (worker
+        pools pass it on). Returns None when memory is not limited.
+        """
+        budget = MemoryBudget(self.memory_budget) if self.memory_budget else None
+        install_budget(budget)
+        return budget
+
+
+def describe_memory_use(budget):
+    """Return the run summary line reporting the use of a MemoryBudget."""
+    return (f"Memory budget: peak {format_bytes(budget.peak)} of {format_bytes(budget.limit)} reserved, "
+            f"{budget.waits} waits for memory")
+
+
+def parse_bytes(text):
+    """Parse a byte count, optionally with a K, M or G suffix (powers of 1024)."""
+    text = str(text).strip().upper().rstrip('B')
+    multiplier = 1
+    if text[-1:] in BYTE_SUFFIXES:
+        multiplier = BYTE_SUFFIXES[text[-1]]
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+
+def environ_bytes(environ, name, default, positive=False):
+    """
+    Read a byte count from the environment variable name (default if unset).
+    Raises ValueError naming the variable if it does not parse, is negative,
+    or is 0 when positive is set.
+    """
+    value = environ.get(name, default)
+    try:
+        size = parse_bytes(value)
+    except (ValueError, OverflowError):
+        size = None
+    if size is None or size < 0 or (positive and size == 0):
+        kind = "a positive byte count" if positive else "a byte count"
+        raise ValueError(f"{name} must be {kind} (like 512K or 4M), got {value!r}")
+    return size
+
+
+def format_bytes(size):
+    """Format a byte count for display, like format_bytes in scan_project.sh."""
+    if size < 1024:
+        return f"{size}B"
+    if size < 1024 * 1024:
+        return f"{size // 1024}KB"
+    return f"{size // (1024 * 1024)}MB"
+
+
+def record_size(record):
+    """Return the size of a walked file from its cached stat, or 0 if unknown."""
+    try:
+        return record.entry.stat().st_size
+    except (AttributeError, OSError):
+        return 0
+
+
+class _Overflow:
+    """Aggregate of the entries collapsed out of one directory listing."""
+
+    __slots__ = ('entries', 'files', 'dirs', 'size', 'extensions')
+
+    def __init__(self):
+        self.entries = 0
+        self.files = 0
+        self.dirs = 0
+        self.size = 0
+        self.extensions = Counter()
+
+    def add(self, record):
+        if record.is_dir:
+            self.dirs += 1
+        else:
+            self.files += 1
+            self.size += record_size(record)
+            self.extensions[os.path.splitext(record.name)[1].lower() or '(no ext)'] += 1
+
+    def describe(self, top_extensions=5):
+        common = self.extensions.most_common(top_extensions)
+        histogram = ', '.join(f"{ext} x{count}" for ext, count in common)
+        if len(self.extensions) > top_extensions:
+            histogram += ', ...'
+        text = (f"... {self.entries} more entries ({self.files} files, {self.dirs} dirs, "
+                f"{format_bytes(self.size)}")
+        return text + (f"; {histogram})" if histogram else ")")
+
+
+class TreeBudget:
+    """
+    Per-directory entry budget for the structure section.
+
+    The first max_entries children of every directory are shown; the rest,
+    subtrees included, collapse into one aggregate line (entry count, file and
+    directory totals, bytes, extension histogram) placed after the directory's
+    shown children. The walk itself is not cut short, so hidden files are still
+    collected for content. max_entries=0 shows everything.
+    """
+
+    def __init__(self, max_entries=0):
+        self.max_entries = max_entries
+        # One [depth, shown, _Overflow or None] frame per open directory listing
+        self.frames = []
+        # Depth of the collapsed directory whose subtree is being skipped
+        self.hidden_depth = None
+
+    def collapsed_before(self, depth):
+        """Yield (depth, summary) for listings that end before an entry at this depth."""
+        while self.frames and self.frames[-1][0] > depth:
+            frame_depth, _shown, overflow = self.frames.pop()
+            if overflow is not None:
+                yield frame_depth, overflow.describe()
+
+    def collapsed_at_end(self):
+        """Yield (depth, summary) for the listings still open when the walk ends."""
+        return self.collapsed_before(-1)
+
+    def admit(self, record):
+        """Account for a walked record and return whether its line is shown."""
+        if not self.max_entries:
+            return True
+        depth = record.depth
+        if self.hidden_depth is not None:
+            if depth > self.hidden_depth:
+                self.frames[-1][2].add(record)
+                return False
+            self.hidden_depth = None
+
+        if not self.frames or self.frames[-1][0] < depth:
+            self.frames.append([depth, 0, None])
+        frame = self.frames[-1]
+        if frame[1] < self.max_entries:
+            frame[1] += 1
+            return True
+
+        if frame[2] is None:
+            frame[2] = _Overflow()
+        frame[2].entries += 1
+        frame[2].add(record)
+        if record.is_dir:
+            self.hidden_depth = depth
+        return False
+
+
+# FileManifest flags
+# Drop the file silently if its content turns out to be binary
+FLAG_SKIP_IF_BINARY = 0x02
+
+
+class FileManifest:
+    """
+    Compact, ordered list of the files whose content goes into a summary.
+
+    Directories and file names are interned once in tables; each file is then
+    just a slot in parallel arrays of directory ids, name ids, sizes and flags.
+    Files are kept in the order they were walked, which is the sorted
+    traversal order, so the content section needs no post-sort.
+
+    Sizes cost a stat per file, so they are only kept with track_sizes (to
+    weight content shards); otherwise entries have a size of None and the
+    content stage takes sizes from the open files.
+    """
+
+    def __init__(self, root_dir, track_sizes=False):
+        self.root_dir = root_dir
+        # Directory table: absolute path and '/'-separated relative prefix
+        self.dir_paths = []
+        self.dir_prefixes = []
+        self._dir_ids = {}
+        self.names = []
+        self._name_ids = {}
+        self.dir_ids = array('I')
+        self.name_ids = array('I')
+        self.sizes = array('q') if track_sizes else None
+        self.flags = array('B')
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def _intern_dir(self, parent):
+        dir_id = self._dir_ids.get(parent)
+        if dir_id is None:
+            dir_id = self._dir_ids[parent] = len(self.dir_paths)
+            relative_dir = os.path.relpath(parent, self.root_dir).replace('\\', '/')
+            self.dir_paths.append(parent)
+            self.dir_prefixes.append('' if relative_dir == '.' else relative_dir + '/')
+        return dir_id
+
+    def _intern_name(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def add(self, record, flags=0):
+        """Append a walked file record."""
+        parent = os.path.dirname(record.path)
+        self.dir_ids.append(self._intern_dir(parent))
+        self.name_ids.append(self._intern_name(record.name))
+        if self.sizes is not None:
+            self.sizes.append(record_size(record))
+        self.flags.append(flags)
+
+    def relative_path(self, index):
+        """Return the '/'-separated path of a file relative to the project root."""
+        return self.dir_prefixes[self.dir_ids[index]] + self.names[self.name_ids[index]]
+
+    def absolute_path(self, index):
+        """Return the absolute path of a file."""
+        return os.path.join(self.dir_paths[self.dir_ids[index]], self.names[self.name_ids[index]])
+
+    def entries(self, start=0, stop=None):
+        """Yield (relative_path, absolute_path, size, flags) for the files in range(start, stop), in order."""
+        sizes = self.sizes
+        for index in range(start, len(self) if stop is None else stop):
+            yield (self.relative_path(index), self.absolute_path(index),
+                   sizes[index] if sizes is not None else None, self.flags[index])
+
+    def __iter__(self):
+        """Yield (relative_path, absolute_path, size, flags) for each file in order."""
+        return self.entries()
+
+
+def _entry_name(entry):
+    return entry.name
+
+
+def scan_directory(path):
+    """Return the entries of a directory as os.DirEntry objects sorted by name."""
+    with os.scandir(path) as it:
+        entries = list(it)
+    entries.sort(key=_entry_name)
+    return entries
+
+
+def entry_is_dir(entry):
+    """Check if an entry is a directory, following symlinks like os.path.isdir."""
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def file_identity(stat_result):
+    """Return the (st_dev, st_ino) pair identifying a file or directory."""
+    return (stat_result.st_dev, stat_result.st_ino)
+
+
+def _directory_identity(entry):
+    """Identity of a directory entry, following symlinks; None if it cannot be stat'ed."""
+    try:
+        return file_identity(entry.stat())
+    except OSError:
+        return None
+
+
+class LinkTracker:
+    """Remembers which files were emitted, so hardlinks and symlinks to them can be referenced."""
+
+    def __init__(self):
+        self.emitted = {}
+
+    def identity(self, path):
+        """Return the identity of the file behind path, or None if it cannot be stat'ed."""
+        try:
+            return file_identity(os.stat(path))
+        except OSError:
+            return None
+
+    def emitted_as(self, identity):
+        """Return the relative path the file was first emitted under, or None."""
+        if identity is None:
+            return None
+        return self.emitted.get(identity)
+
+    def remember(self, identity, relative_path):
+        """Record that the file was emitted under relative_path."""
+        if identity is not None:
+            self.emitted.setdefault(identity, relative_path)
+
+
+def _expand_directory(path, depth, ignore, descend, ignore_chain):
+    """
+    List a directory and turn its non-ignored items into WalkEntry records.
+
+    Returns the records together with the .gitignore chain that applies to
+    the directory's children (None when .gitignore support is off).
+    """
+    listed_items = scan_directory(path)
+    if ignore_chain is not None:
+        has_gitignore = any(entry.name == '.gitignore' for entry in listed_items)
+        ignore_chain = ignore_chain.enter(path, has_gitignore)
+
+    records = []
+    for entry in listed_items:
+        name = entry.name
+        is_dir = entry_is_dir(entry)
+        if ignore is not None and ignore(name, is_dir, depth):
+            continue
+        if ignore_chain is not None:
+            if name == '.git' or ignore_chain.is_ignored(entry.path, is_dir):
+                continue
+        will_descend = is_dir and (descend is None or descend(name, depth))
+        if will_descend:
+            # Fetch the stat here so the cycle check finds it cached on the entry
+            _directory_identity(entry)
+        records.append(WalkEntry(depth, name, entry.path, is_dir, will_descend, entry, False))
+    return records, ignore_chain
+
+
+def walk_tree(root, ignore=None, descend=None, workers=0, gitignore=False):
+    """
+    Walk a directory tree depth-first, yielding WalkEntry records lazily.
+
+    ignore(name, is_dir, depth) drops an item (and its subtree) from the walk;
+    descend(name, depth) decides whether a directory's children are listed.
+    Children are produced in sorted name order right after their parent, using
+    an explicit stack so deeply nested trees never hit the recursion limit.
+
+    With workers > 1 the listings of the directories waiting on the stack are
+    fetched ahead of time by a thread pool (one level of lookahead), which
+    overlaps the round-trips of slow or network filesystems. Records are still
+    consumed in the same order, so the output matches the serial walk.
+
+    With gitignore=True, nested .gitignore files (and .git/info/exclude) are
+    honoured: ignored entries are dropped before their subtree is listed.
+
+    A directory whose (st_dev, st_ino) was already walked is yielded with
+    revisit=True and descend=False, which bounds the walk on symlink cycles.
+    """
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    prefetched = {}
+
+    def children_of(path, depth, ignore_chain):
+        future = prefetched.pop(path, None)
+        try:
+            if future is not None:
+                records, child_chain = future.result()
+            else:
+                records, child_chain = _expand_directory(path, depth, ignore, descend, ignore_chain)
+        except OSError as e:
+            print(f"Warning: Could not read directory {path}: {e}", file=sys.stderr)
+            return []
+        if pool is not None:
+            for record in records:
+                if record.descend:
+                    prefetched[record.path] = pool.submit(
+                        _expand_directory, record.path, depth + 1, ignore, descend, child_chain)
+        return [(record, child_chain) for record in records]
+
+    root_chain = IgnoreChain.for_root(root) if gitignore else None
+    visited = set()
+    try:
+        visited.add(file_identity(os.stat(root)))
+    except OSError:
+        pass
+    try:
+        stack = children_of(root, 0, root_chain)
+        stack.reverse()
+        while stack:
+            record, ignore_chain = stack.pop()
+            if record.descend:
+                identity = _directory_identity(record.entry)
+                if identity in visited:
+                    record = record._replace(descend=False, revisit=True)
+                elif identity is not None:
+                    visited.add(identity)
+            yield record
+            if record.descend:
+                children = children_of(record.path, record.depth + 1, ignore_chain)
+                children.reverse()
+                stack.extend(children)
+    finally:
+        if pool is not None:
+            for future in prefetched.values():
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+def walk_index(root, tracked_files, ignore=None, descend=None):
+    """
+    Walk the tracked files of a checkout, yielding the same WalkEntry stream as walk_tree.
+
+    tracked_files holds (relative_path, IndexStat) pairs from read_tracked_files;
+    directories are implied by the paths. Each directory with tracked files is
+    listed once, so tracked files deleted from the working tree are left out.
+    """
+    # Nested dicts: directory name -> dict of children, file name -> IndexEntry
+    tree = {}
+    for relative_path, stat in tracked_files:
+        parts = relative_path.split('/')
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        if parts[-1] not in node:
+            path = os.path.join(root, *parts)
+            node[parts[-1]] = IndexEntry(parts[-1], path, stat)
+
+    def present_names(path):
+        try:
+            return set(os.listdir(path))
+        except FileNotFoundError:
+            return set()
+        except OSError:
+            # Unlistable: keep what the index says
+            return None
+
+    def children_of(node, path, depth):
+        records = []
+        present = present_names(path)
+        for name in sorted(node):
+            if present is not None and name not in present:
+                continue
+            child = node[name]
+            if isinstance(child, dict):
+                entry, is_dir, child_path = None, True, os.path.join(path, name)
+            else:
+                # Files (and submodules) have no tracked children to walk
+                entry, is_dir, child_path = child, child.is_dir(), child.path
+                child = {}
+            if ignore is not None and ignore(name, is_dir, depth):
+                continue
+            will_descend = is_dir and (descend is None or descend(name, depth))
+            records.append((WalkEntry(depth, name, child_path, is_dir, will_descend, entry, False), child))
+        records.reverse()
+        return records
+
+    stack = children_of(tree, root, 0)
+    while stack:
+        record, node = stack.pop()
+        yield record
+        if record.descend:
+            stack.extend(children_of(node, record.path, record.depth + 1))
+
+
+def walk_project(root, ignore=None, descend=None, settings=None, announce=True):
+    """
+    Walk a project from the source selected in settings.
+
+    With source 'git' the tracked files are read straight from .git/index;
+    projects that are not git checkouts fall back to the filesystem walk.
+    announce=False leaves out the line reporting which source was used.
+    """
+    if settings is None:
+        settings = ScanSettings()
+    if settings.source == 'git':
+        tracked_files = read_tracked_files(root)
+        if tracked_files is not None:
+            if announce:
+                print(f"  Source: git index ({len(tracked_files)} tracked files)")
+            return walk_index(root, tracked_files, ignore=ignore, descend=descend)
+        if announce:
+            print("  Source: filesystem (no usable git index found)")
+    return walk_tree(root, ignore=ignore, descend=descend,
+                     workers=settings.workers, gitignore=settings.gitignore)
+
+
+def open_manifest_files(manifest, settings=None, previous=None, verdicts=None, max_size=0):
+    """
+    Yield (relative_path, absolute_path, size, flags, opened) for every file of
+    a FileManifest, in order, where opened is the OpenedFile from open_content
+    (with its encoding detected when settings.detect_encoding is set, and its
+    digest computed when settings.incremental or settings.render_cache is).
+
+    With settings.readers > 1, reader threads open and read files ahead of the
+    caller within settings.prefetch_budget bytes, so disk reads overlap with
+    writing the summary.
+
+    Files unchanged since the PreviousSummary previous (same stat, or same
+    digest) are not opened or not read: opened.reused holds their section.
+    Files the BinaryVerdicts verdicts know as binary are not opened either:
+    opened.binary is set. Files over max_size bytes (if not 0) are never read
+    nor digested: the OpenedFile only holds their size and stat.
+    """
+    if settings is None:
+        settings = ScanSettings()
+    # Files copy_content would read whole are read whole by the readers
+    whole_file_limit = settings.chunk_size
+    if settings.mmap_threshold:
+        whole_file_limit = min(whole_file_limit, settings.mmap_threshold - 1)
+
+    want_digest = settings.incremental or bool(settings.render_cache)
+
+    def load(item):
+        record = previous.lookup(item[0]) if previous is not None else None
+        stat = None
+        if record is not None or verdicts is not None:
+            try:
+                stat = os.stat(item[1])
+            except OSError:
+                pass
+        if stat is not None:
+            if record is not None and stat_matches(record, stat):
+                return OpenedFile(stat=stat, reused=record)
+            if verdicts is not None and verdicts.is_binary(stat):
+                return OpenedFile(stat=stat, binary=True)
+            if max_size and stat.st_size > max_size:
+                return OpenedFile(size=stat.st_size, stat=stat)
+        opened = open_content(item[1], whole_file_limit, settings.detect_encoding, want_digest, max_size)
+        if record is not None and opened.digest == record.digest:
+            opened.close()
+            return OpenedFile(stat=opened.stat, reused=record)
+        return opened
+
+    def cost(item):
+        size = item[2]
+        # Without a size from the walk, reserve the most load() may hold
+        if size is None:
+            return whole_file_limit
+        return size if size <= whole_file_limit else SNIFF_SIZE
+
+    for item, opened in prefetch(manifest, load, cost, settings.readers, settings.prefetch_budget):
+        yield item + (opened,)
+
+
+def render_content(infile, outfile, opened, settings, cache=None):
+    """
+    Write the body of a file's section (an OpenedFile and its taken infile)
+    with copy_content, taking it from the RenderCache cache when there is one.
+    """
+    def render(target):
+        copy_content(infile, target, opened.size, opened.head, chunk_size=settings.chunk_size,
+                     passthrough=settings.passthrough, mmap_threshold=settings.mmap_threshold,
+                     encoding=opened.encoding, numbered=settings.line_numbers)
+
+    if cache is not None and opened.digest is not None:
+        cache.write_section(outfile, opened.digest, settings.section_options(), render)
+    else:
+        render(outfile)
+
+
+def write_file_contents(outfile, files, settings, previous=None, check=None, max_size=0,
+                        binary_verdicts=False):
+    """
+    Write the content section of each (relative_path, file_path, size, flags) manifest entry.
+
+    check(outfile, relative_path, opened, flags, verdicts), if given, runs for
+    every file before its content is rendered and returns True when it has
+    taken care of the file: written a placeholder section, or nothing to leave
+    the file out. max_size is passed on to open_manifest_files; with
+    binary_verdicts, so are the BinaryVerdicts of settings (then given to check).
+
+    Returns the SectionLog of the sections written when settings.incremental is set.
+    """
+    link_tracker = LinkTracker() if settings.dedup_links else None
+    sections = SectionRecorder(outfile, previous) if settings.incremental else None
+    cache = settings.open_render_cache()
+    verdicts = settings.open_binary_verdicts() if binary_verdicts else None
+
+    # Files are opened (and read ahead, with reader threads) in manifest order
+    content_files = open_manifest_files(files, settings, previous, verdicts, max_size)
+    for relative_path, file_path, _file_size, file_flags, opened in content_files:
+        # Unchanged since the previous run: the section is copied from the previous summary
+        if sections is not None and sections.begin(relative_path, opened):
+            continue
+
+        # Set once the section is open, so an error mid-copy does not open it twice
+        header_written = False
+        try:
+            # Hardlinks/symlinks to a file already emitted only reference it
+            if link_tracker is not None:
+                identity = link_tracker.identity(file_path)
+                first_path = link_tracker.emitted_as(identity)
+                if first_path is not None:
+                    opened.close()
+                    outfile.write_header(relative_path)
+                    outfile.write(f"*** SAME FILE AS {first_path} - CONTENT SHOWN ABOVE ***\n")
+                    outfile.write_footer(relative_path)
+                    continue
+
+            if check is not None and check(outfile, relative_path, opened, file_flags, verdicts):
+                opened.close()
+                continue
+
+            with opened.take() as infile:
+                content_size = opened.size
+                # Skip files that are empty (by stat size)
+                if content_size == 0:
+                    continue
+
+                outfile.write_header(relative_path)
+                header_written = True
+                # Stream in bounded chunks with the detected decoder; plain UTF-8 is passed through undecoded
+                # (taken from the render cache, if any, for content rendered before)
+                render_content(infile, outfile, opened, settings, cache)
+                if link_tracker is not None:
+                    link_tracker.remember(identity, relative_path)
+                # Add clear separator between files
+                outfile.write_footer(relative_path)
+
+        except Exception as e:
+            if sections is not None:
+                sections.abandon()
+            if header_written:
+                # After the part of the content copied before the error
+                outfile.write("\n")
+            else:
+                outfile.write_header(relative_path)
+            outfile.write(f"*** Error reading file: {e} ***\n")
+            outfile.write_footer(relative_path, ERROR_SECTION_FOOTER)
+
+    return sections.finish() if sections is not None else None
+
+
+def render_shard(shard_filename, files, settings, previous=None, **options):
+    """Render the content sections of a range of manifest entries into a shard file (options as for write_file_contents)."""
+    with SummaryWriter(shard_filename, settings.output_buffer) as outfile:
+        return write_file_contents(outfile, files, settings, previous, **options)
@@ -0,0 +1,181 @@
+"""
+.gitignore Support for the Traversal Engine
+
+Each .gitignore is compiled once into a GitIgnoreMatcher: its patterns are
+translated to regular expressions and consecutive patterns of the same kind
+are merged into one alternation, so matching an entry costs a handful of regex
+calls however long the file is. IgnoreChain stacks the matchers of nested
+directories; the walker consults it before descending, so ignored subtrees are
+never listed at all.
+"""
+
+import os
+import re
+
+
+def _translate_glob(pattern):
+    """Translate a gitignore glob (without anchoring or trailing slash) to a regex."""
+    parts = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                at_start = i == 0 or pattern[i - 1] == '/'
+                at_end = i + 2 == n or pattern[i + 2] == '/'
+                if at_start and at_end:
+                    if i + 2 == n:
+                        parts.append('.*')                # 'dir/**' or '**'
+                        i += 2
+                    else:
+                        parts.append('(?:.*/)?')          # '**/' anywhere
+                        i += 3
+                    continue
+            parts.append('[^/]*')
+            while i < n and pattern[i] == '*':
+                i += 1
+            continue
+        if c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                parts.append('\\[')
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                if body[:1] in '!^':
+                    body = '^' + body[1:]
+                parts.append(f'[{body}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+def parse_gitignore_line(line):
+    """
+    Parse one .gitignore line into (regex_source, negate, dir_only).
+
+    Returns None for blank lines and comments.
+    """
+    line = line.rstrip('\n').rstrip('\r')
+    # Trailing spaces are ignored unless escaped with a backslash
+    stripped = line.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(line):
+        stripped += ' '
+    line = stripped
+    if not line or line.startswith('#'):
+        return None
+
+    negate = False
+    if line.startswith('!'):
+        negate = True
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    # A slash at the beginning or in the middle anchors the pattern to the
+    # directory of the .gitignore; otherwise it matches at any level
+    anchored = '/' in line
+    line = line.lstrip('/')
+    regex = _translate_glob(line)
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return regex, negate, dir_only
+
+
+class GitIgnoreMatcher:
+    """Compiled patterns of a single .gitignore file."""
+
+    def __init__(self, base_dir, lines):
+        self.base_prefix_len = len(os.path.join(base_dir, ''))
+        # Runs of consecutive patterns sharing (negate, dir_only), each compiled
+        # into one regex. Later patterns take precedence, so runs are kept in
+        # reverse order for matching.
+        self.runs = []
+        current_key = None
+        current_sources = []
+        for line in lines:
+            parsed = parse_gitignore_line(line)
+            if parsed is None:
+                continue
+            regex, negate, dir_only = parsed
+            if (negate, dir_only) != current_key and current_sources:
+                self._add_run(current_key, current_sources)
+                current_sources = []
+            current_key = (negate, dir_only)
+            current_sources.append(regex)
+        if current_sources:
+            self._add_run(current_key, current_sources)
+        self.runs.reverse()
+
+    def _add_run(self, key, sources):
+        negate, dir_only = key
+        compiled = re.compile('|'.join(f'(?:{source})' for source in sources), re.DOTALL)
+        self.runs.append((compiled.fullmatch, negate, dir_only))
+
+    def match(self, path, is_dir):
+        """Return True if ignored, False if re-included, None if no pattern applies."""
+        relative_path = path[self.base_prefix_len:].replace('\\', '/')
+        for fullmatch, negate, dir_only in self.runs:
+            if dir_only and not is_dir:
+                continue
+            if fullmatch(relative_path):
+                return not negate
+        return None
+
+    @classmethod
+    def from_file(cls, base_dir, file_path):
+        """Compile a .gitignore file, returning None if it has no usable patterns."""
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                matcher = cls(base_dir, f.readlines())
+        except OSError:
+            return None
+        return matcher if matcher.runs else None
+
+
+class IgnoreChain:
+    """The .gitignore matchers in effect for one directory, deepest first."""
+
+    def __init__(self, matchers=()):
+        self.matchers = tuple(matchers)
+
+    @classmethod
+    def for_root(cls, root_dir):
+        """Start a chain at the project root, honouring .git/info/exclude."""
+        exclude = GitIgnoreMatcher.from_file(root_dir, os.path.join(root_dir, '.git', 'info', 'exclude'))
+        return cls([exclude] if exclude is not None else [])
+
+    def enter(self, dir_path, has_gitignore):
+        """Return the chain for the children of dir_path."""
+        if not has_gitignore:
+            return self
+        matcher = GitIgnoreMatcher.from_file(dir_path, os.path.join(dir_path, '.gitignore'))
+        if matcher is None:
+            return self
+        return IgnoreChain((matcher,) + self.matchers)
+
+    def is_ignored(self, path, is_dir):
+        """Check if an entry is ignored; the deepest .gitignore with an opinion wins."""
+        for matcher in self.matchers:
+            verdict = matcher.match(path, is_dir)
+            if verdict is not None:
+                return verdict
+        return False
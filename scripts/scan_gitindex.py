@@ -0,0 +1,189 @@
+"""
+Pure-Python Reader for the Git Index (.git/index)
+
+Lists the tracked files of a checkout with one sequential read of the index
+file instead of walking the working tree. Index versions 2, 3 and 4 (path
+prefix compression) are supported. Split and sparse indexes are reported as
+unreadable so callers can fall back to the filesystem walk.
+"""
+
+import os
+import struct
+
+INDEX_SIGNATURE = b'DIRC'
+SUPPORTED_VERSIONS = (2, 3, 4)
+
+# Fixed part of an entry: ctime/mtime (s, ns), dev, ino, mode, uid, gid,
+# size, object id and flags
+_ENTRY_HEADER = struct.Struct('>10I20sH')
+_EXTENDED_FLAGS = struct.Struct('>H')
+
+FLAG_EXTENDED = 0x4000
+FLAG_NAME_MASK = 0x0FFF
+EXTENDED_FLAG_SKIP_WORKTREE = 0x4000
+
+MODE_TYPE_MASK = 0o170000
+MODE_SYMLINK = 0o120000
+MODE_GITLINK = 0o160000
+MODE_SPARSE_DIR = 0o040000
+
+# Extensions that mean the entries in this file are not the full picture
+_INCOMPLETE_EXTENSIONS = {b'link', b'sdir'}
+
+
+class IndexStat:
+    """The stat fields cached in an index entry, named like os.stat_result."""
+
+    __slots__ = ('st_mode', 'st_dev', 'st_ino', 'st_size', 'st_mtime_ns')
+
+    def __init__(self, mode, dev, ino, size, mtime_ns):
+        self.st_mode = mode
+        self.st_dev = dev
+        self.st_ino = ino
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+
+
+class IndexEntry:
+    """A tracked path, exposing the same methods the walker uses on os.DirEntry."""
+
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, name, path, stat):
+        self.name = name
+        self.path = path
+        self._stat = stat
+
+    def is_dir(self):
+        mode = self._stat.st_mode & MODE_TYPE_MASK
+        if mode == MODE_GITLINK:
+            return True
+        if mode == MODE_SYMLINK:
+            return os.path.isdir(self.path)
+        return False
+
+    def is_file(self):
+        return not self.is_dir()
+
+    def is_symlink(self):
+        return self._stat.st_mode & MODE_TYPE_MASK == MODE_SYMLINK
+
+    def stat(self):
+        return self._stat
+
+
+def find_index_file(project_dir):
+    """Return the path of the index for a checkout rooted at project_dir, or None."""
+    dot_git = os.path.join(project_dir, '.git')
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        # Worktrees and submodules use a '.git' file pointing at the real git dir
+        try:
+            with open(dot_git, 'r', encoding='utf-8') as f:
+                line = f.readline().strip()
+        except OSError:
+            return None
+        if not line.startswith('gitdir:'):
+            return None
+        git_dir = os.path.join(project_dir, line[len('gitdir:'):].strip())
+    else:
+        return None
+    index_file = os.path.join(git_dir, 'index')
+    return index_file if os.path.isfile(index_file) else None
+
+
+def _read_varint(data, pos):
+    """Decode the offset varint used by index v4 path compression."""
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def parse_index(data):
+    """
+    Parse the raw bytes of an index file.
+
+    Returns a list of (path_bytes, IndexStat), one per path present in the
+    working tree, in index order, or None if the index cannot be used.
+    """
+    if len(data) < 12 or data[:4] != INDEX_SIGNATURE:
+        return None
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in SUPPORTED_VERSIONS:
+        return None
+
+    entries = []
+    pos = 12
+    previous_path = b''
+    unpack_header = _ENTRY_HEADER.unpack_from
+    for _ in range(count):
+        entry_start = pos
+        (_ctime_s, _ctime_ns, mtime_s, mtime_ns, dev, ino, mode, _uid, _gid, size,
+         _oid, flags) = unpack_header(data, pos)
+        pos += _ENTRY_HEADER.size
+        extended_flags = 0
+        if version >= 3 and flags & FLAG_EXTENDED:
+            extended_flags, = _EXTENDED_FLAGS.unpack_from(data, pos)
+            pos += _EXTENDED_FLAGS.size
+
+        if version == 4:
+            strip, pos = _read_varint(data, pos)
+            end = data.index(b'\x00', pos)
+            path = previous_path[:len(previous_path) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            name_length = flags & FLAG_NAME_MASK
+            if name_length == FLAG_NAME_MASK:
+                end = data.index(b'\x00', pos)
+            else:
+                end = pos + name_length
+            path = data[pos:end]
+            # Entries are NUL-padded to a multiple of eight bytes
+            pos = entry_start + ((end - entry_start + 8) & ~7)
+        previous_path = path
+
+        if mode & MODE_TYPE_MASK == MODE_SPARSE_DIR:
+            return None
+        # Skip-worktree paths are not on disk; conflicted paths appear once per
+        # merge stage, next to each other
+        if extended_flags & EXTENDED_FLAG_SKIP_WORKTREE:
+            continue
+        if entries and entries[-1][0] == path:
+            continue
+        entries.append((path, IndexStat(mode, dev, ino, size, mtime_s * 10**9 + mtime_ns)))
+
+    # Extensions follow the entries; the last 20 bytes are the checksum
+    while pos + 8 <= len(data) - 20:
+        signature = data[pos:pos + 4]
+        ext_size, = struct.unpack_from('>I', data, pos + 4)
+        if signature in _INCOMPLETE_EXTENSIONS:
+            return None
+        pos += 8 + ext_size
+    return entries
+
+
+def read_tracked_files(project_dir):
+    """
+    Return the tracked files of a checkout as (relative_path, IndexStat) pairs.
+
+    Relative paths use '/' separators. Returns None when project_dir is not the
+    root of a git checkout or its index cannot be read.
+    """
+    index_file = find_index_file(project_dir)
+    if index_file is None:
+        return None
+    try:
+        with open(index_file, 'rb') as f:
+            data = f.read()
+        entries = parse_index(data)
+    except (OSError, struct.error, ValueError, IndexError):
+        return None
+    if entries is None:
+        return None
+    return [(os.fsdecode(path), stat) for path, stat in entries]
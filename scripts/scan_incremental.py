@@ -0,0 +1,288 @@
+"""
+Incremental Rescans for the Project Summary Generators
+
+With SCAN_INCREMENTAL, every summary gets a manifest next to it
+(<summary>.manifest, JSON) recording, for each file section of the content
+part, the file's size, mtime_ns, device, inode and content digest, and the
+section's byte offsets in the summary.
+
+On the next run a file whose stat still matches is not opened at all, and a
+file whose stat changed but whose digest did not is not rendered: their
+sections are range-copied from the previous summary, runs of consecutive
+sections in one copy. The new summary is written to a temporary file that
+replaces the previous one at the end, so the previous one stays readable for
+the whole run.
+
+With SCAN_SKIP_UNCHANGED, a summary also gets a project fingerprint
+(<summary>.fingerprint): a digest of the project's walk (paths, and the size,
+mtime and inode of every listed file), of the settings and of the scanner's
+code. A project whose fingerprint and summary are unchanged is not rendered.
+"""
+
+import glob
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from scan_content import copy_range
+
+MANIFEST_SUFFIX = '.manifest'
+MANIFEST_VERSION = 1
+
+FINGERPRINT_SUFFIX = '.fingerprint'
+FINGERPRINT_VERSION = 1
+
+# One file section of a summary: the file as it was when rendered, and the
+# section's [start, end) byte range in the summary
+SectionRecord = namedtuple('SectionRecord', ['path', 'size', 'mtime_ns', 'dev', 'ino', 'digest', 'start', 'end'])
+
+
+def manifest_path(output_filename):
+    """Return the path of the manifest kept next to a summary."""
+    return output_filename + MANIFEST_SUFFIX
+
+
+def stat_matches(record, stat):
+    """Check that a file's stat is still the one recorded for its section."""
+    return (stat.st_size == record.size and stat.st_mtime_ns == record.mtime_ns
+            and stat.st_ino == record.ino and stat.st_dev == record.dev)
+
+
+class PreviousSummary:
+    """The previous summary of a project and the sections its manifest records."""
+
+    def __init__(self, output_filename, records):
+        self.output_filename = output_filename
+        self.records = records
+        self._file = None
+
+    def __getstate__(self):
+        # Shard workers open the summary themselves
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+    @classmethod
+    def load(cls, output_filename, settings):
+        """
+        Read the manifest of a summary. Returns None when there is none, or it
+        does not describe the summary on disk or the current rendering settings.
+        """
+        try:
+            with open(manifest_path(output_filename), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            stat = os.stat(output_filename)
+        except (OSError, ValueError):
+            return None
+        if (manifest.get('version') != MANIFEST_VERSION
+                or manifest.get('options') != settings.section_options()
+                or manifest.get('output_size') != stat.st_size
+                or manifest.get('output_mtime_ns') != stat.st_mtime_ns):
+            return None
+        try:
+            records = {fields[0]: SectionRecord(*fields) for fields in manifest['sections']}
+        except (KeyError, TypeError):
+            return None
+        return cls(output_filename, records)
+
+    def lookup(self, path):
+        """Return the SectionRecord of a relative path, or None."""
+        return self.records.get(path)
+
+    def subset(self, paths):
+        """Return the previous summary limited to the records of paths, for a shard worker."""
+        records = self.records
+        return PreviousSummary(self.output_filename, {path: records[path] for path in paths if path in records})
+
+    def copy_sections(self, outfile, start, end):
+        """Append the [start, end) byte range of the previous summary to outfile."""
+        if self._file is None:
+            self._file = open(self.output_filename, 'rb')
+        copy_range(self._file, outfile, start, end - start)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SectionLog:
+    """The sections written to a summary (or shard), and how many were reused."""
+
+    def __init__(self, sections=None, reused=0):
+        self.sections = sections if sections is not None else []
+        self.reused = reused
+
+    def shifted(self, base):
+        """Return this log with every offset moved by base bytes (for a shard appended at base)."""
+        return SectionLog([section._replace(start=section.start + base, end=section.end + base)
+                           for section in self.sections], self.reused)
+
+    def extend(self, other):
+        self.sections.extend(other.sections)
+        self.reused += other.reused
+
+
+class SectionRecorder:
+    """
+    Records the file sections written to a SummaryWriter, taking the ones of
+    unchanged files from the previous summary.
+    """
+
+    def __init__(self, outfile, previous=None):
+        self.outfile = outfile
+        self.previous = previous
+        self.log = SectionLog()
+        self._current = None
+        # [start, end) of the previous summary still to be copied
+        self._pending = None
+
+    def _position(self):
+        position = self.outfile.tell()
+        if self._pending is not None:
+            position += self._pending[1] - self._pending[0]
+        return position
+
+    def _end_current(self):
+        if self._current is not None:
+            path, stat, digest, start = self._current
+            self.log.sections.append(SectionRecord(path, stat.st_size, stat.st_mtime_ns, stat.st_dev,
+                                                   stat.st_ino, digest, start, self._position()))
+            self._current = None
+
+    def _copy_pending(self):
+        if self._pending is not None:
+            self.previous.copy_sections(self.outfile, *self._pending)
+            self._pending = None
+
+    def begin(self, relative_path, opened):
+        """
+        Start the section of a file (an OpenedFile from open_manifest_files).
+
+        Returns True when the file is unchanged and its section is taken from
+        the previous summary, in which case the caller writes nothing for it.
+        """
+        self._end_current()
+        start = self._position()
+        record = opened.reused
+        if record is not None:
+            if self._pending is not None and self._pending[1] == record.start:
+                self._pending[1] = record.end
+            else:
+                self._copy_pending()
+                self._pending = [record.start, record.end]
+            self._current = (relative_path, opened.stat, record.digest, start)
+            self.log.reused += 1
+            return True
+        self._copy_pending()
+        # Files that could not be read are rendered again next time
+        if opened.stat is not None and opened.digest is not None:
+            self._current = (relative_path, opened.stat, opened.digest, start)
+        return False
+
+    def abandon(self):
+        """Leave the current section out of the log: its file failed to render, so it is rendered again next time."""
+        self._current = None
+
+    def finish(self):
+        """Write out the remaining copies and return the SectionLog."""
+        self._end_current()
+        self._copy_pending()
+        if self.previous is not None:
+            self.previous.close()
+        return self.log
+
+
+def _write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+def save_manifest(output_filename, log, settings):
+    """Write the manifest of a just-written summary from its SectionLog."""
+    stat = os.stat(output_filename)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'options': settings.section_options(),
+        'output_size': stat.st_size,
+        'output_mtime_ns': stat.st_mtime_ns,
+        'sections': [list(section) for section in log.sections],
+    }
+    _write_json(manifest_path(output_filename), manifest)
+
+
+def fingerprint_path(output_filename):
+    """Return the path of the project fingerprint kept next to a summary."""
+    return output_filename + FINGERPRINT_SUFFIX
+
+
+def code_stamp(scanner_file):
+    """
+    Return the mtimes of a scanner script and of the scan_* modules next to
+    this one, which render its summary: editing any of them changes the
+    fingerprints of its projects.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    paths = [scanner_file] + sorted(glob.glob(os.path.join(directory, 'scan_*.py')))
+    return {os.path.basename(path): os.stat(path).st_mtime_ns for path in paths}
+
+
+def project_fingerprint(records, config):
+    """
+    Digest a project's WalkEntry records and a JSON-serializable config.
+
+    Files contribute their stat (taken from the walk when it has it), so no
+    file is read; directories contribute how the walk treated them. Files
+    listed from the git index are stat'ed on disk, as their content is read
+    from the working tree.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    for record in records:
+        if record.is_dir:
+            kind = 'revisit' if record.revisit else 'dir' if record.descend else 'listed'
+            line = f"\n{record.depth}\0{record.name}\0{kind}"
+        else:
+            try:
+                if isinstance(record.entry, os.DirEntry):
+                    stat = record.entry.stat()
+                else:
+                    stat = os.stat(record.path)
+                line = (f"\n{record.depth}\0{record.name}\0{stat.st_size}\0{stat.st_mtime_ns}"
+                        f"\0{stat.st_dev}\0{stat.st_ino}")
+            except OSError:
+                line = f"\n{record.depth}\0{record.name}\0unreadable"
+        digest.update(line.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def load_fingerprint(output_filename):
+    """
+    Return the fingerprint saved for a summary, or None when there is none or
+    the summary on disk is no longer the one it was saved with.
+    """
+    try:
+        with open(fingerprint_path(output_filename), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        stat = os.stat(output_filename)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(saved, dict) or saved.get('version') != FINGERPRINT_VERSION
+            or saved.get('output_size') != stat.st_size
+            or saved.get('output_mtime_ns') != stat.st_mtime_ns):
+        return None
+    return saved.get('fingerprint')
+
+
+def save_fingerprint(output_filename, fingerprint):
+    """Save the fingerprint of the project a summary was just written from."""
+    stat = os.stat(output_filename)
+    _write_json(fingerprint_path(output_filename), {
+        'version': FINGERPRINT_VERSION,
+        'fingerprint': fingerprint,
+        'output_size': stat.st_size,
+        'output_mtime_ns': stat.st_mtime_ns,
+    })
@@ -0,0 +1,318 @@
+"""
+Project-Level Parallelism for the Project Summary Generators
+
+Every project writes its own summary file, so projects can be processed in
+separate worker processes. A worker records everything its project prints
+(stdout and stderr, in order) and hands it back with the result; the parent
+replays each project's output as one block, in project order, so logs never
+interleave and read the same as a serial run.
+
+Within a project, the content section can be rendered in shards: contiguous
+ranges of the manifest are rendered by worker processes into temporary files
+next to the summary, which are then appended in order with kernel-side
+copies. Rendering a range is the same code as rendering it serially, so the
+result is byte-identical.
+
+Projects are dispatched largest first, by an estimate of their cost (the size
+of their previous summary, or a pre-walk of the part of the tree the scanner
+lists), so a huge project does not start last. Once no projects are left to
+start, every idle worker adds a token to a shared semaphore; a big project
+rendering its contents takes those tokens to hand shards from the back of its
+queue to helper processes while it renders shards from the front itself.
+"""
+
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+
+from scan_content import append_file
+from scan_engine import record_size, render_shard, write_file_contents
+from scan_incremental import SectionLog
+from scan_memory import current_budget, install_budget
+
+# Shards per rendering process, so an expensive range does not hold up the rest
+SHARDS_PER_WORKER = 4
+
+# Projects with less content than this are never split for idle workers
+STEAL_MIN_BYTES = 8 * 1024 * 1024
+
+# In a project worker of run_projects: (semaphore counting idle workers, pool size)
+_idle_workers = None
+
+# Returned by a process_project that found its summary up to date
+UP_TO_DATE = 'up to date'
+
+
+def resolve_jobs(jobs):
+    """Return the number of worker processes for a --jobs value (0: one per CPU)."""
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+class _RecordingStream(io.TextIOBase):
+    """Text stream appending (stream name, text) pairs to a shared record list."""
+
+    def __init__(self, name, records):
+        self.name = name
+        self.records = records
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.records.append((self.name, text))
+        return len(text)
+
+
+def _print_project(project_name, process_project, args):
+    """Print the banner of one project around its process_project call; return its result."""
+    print(f"\n[Project: {project_name}]")
+    result = process_project(*args)
+    print()
+    return result
+
+
+def _run_recorded(project_name, process_project, args):
+    """Run one project in a worker, returning (result, recorded output)."""
+    records = []
+    with redirect_stdout(_RecordingStream('stdout', records)), \
+            redirect_stderr(_RecordingStream('stderr', records)):
+        try:
+            result = _print_project(project_name, process_project, args)
+        except Exception as e:
+            print(f"\n  ✗ Unexpected error occurred: {e}", file=sys.stderr)
+            result = False
+    return result, records
+
+
+def _replay(records):
+    for name, text in records:
+        getattr(sys, name).write(text)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+def estimate_project_cost(project_dir, output_filename, walk=None):
+    """
+    Estimate the cost of processing a project: the size of its previous
+    summary if there is one, otherwise the bytes of the files listed by
+    walk(project_dir) (the scanner's own walk, so ignored and untargeted
+    directories are not visited), or 0 without walk.
+    """
+    try:
+        return os.stat(output_filename).st_size
+    except OSError:
+        pass
+    if walk is None:
+        return 0
+    return sum(record_size(record) for record in walk(project_dir) if not record.is_dir)
+
+
+def _init_project_worker(idle_workers, jobs, budget):
+    global _idle_workers
+    _idle_workers = (idle_workers, jobs)
+    install_budget(budget)
+
+
+def run_projects(process_project, projects, jobs=1, walk=None):
+    """
+    Run process_project(*args) for each (project_name, args) of projects, args
+    starting with (project_dir, output_filename).
+
+    With jobs > 1 the projects run in a pool of that many processes, largest
+    estimated cost first (see estimate_project_cost, given the scanner's
+    walk); their console output is printed one project at a time, in the
+    given order. Returns the results of process_project, in the given order:
+    True or UP_TO_DATE when a project succeeded, False when it failed.
+    """
+    if jobs <= 1 or len(projects) <= 1:
+        return [_print_project(project_name, process_project, args) for project_name, args in projects]
+
+    costs = [estimate_project_cost(args[0], args[1], walk) for _project_name, args in projects]
+    dispatch_order = sorted(range(len(projects)), key=lambda i: -costs[i])
+    workers = min(jobs, len(projects))
+    idle_workers = multiprocessing.Semaphore(0)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_project_worker,
+                             initargs=(idle_workers, workers, current_budget())) as executor:
+        futures = [None] * len(projects)
+        for i in dispatch_order:
+            project_name, args = projects[i]
+            futures[i] = executor.submit(_run_recorded, project_name, process_project, args)
+
+        # A worker finishing when no project is left to start stays idle: lend it out
+        remaining = len(projects)
+
+        def project_done(_future):
+            nonlocal remaining
+            remaining -= 1
+            if remaining < workers:
+                idle_workers.release()
+
+        for future in futures:
+            future.add_done_callback(project_done)
+
+        for (project_name, _args), future in zip(projects, futures):
+            try:
+                result, records = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed, or the result could not be sent back)
+                result = False
+                records = [('stdout', f"\n[Project: {project_name}]\n"),
+                           ('stderr', f"\n  ✗ Worker failed: {e}\n"),
+                           ('stdout', "\n")]
+            _replay(records)
+            results.append(result)
+    return results
+
+
+def shard_ranges(sizes, shard_count):
+    """
+    Split range(len(sizes)) into at most shard_count contiguous (start, stop)
+    ranges of similar weight, a file weighing its size plus one byte.
+    """
+    total = sum(sizes) + len(sizes)
+    ranges = []
+    start = 0
+    weight = 0
+    for i, size in enumerate(sizes):
+        weight += size + 1
+        if len(ranges) < shard_count - 1 and weight * shard_count >= total * (len(ranges) + 1):
+            ranges.append((start, i + 1))
+            start = i + 1
+    if start < len(sizes):
+        ranges.append((start, len(sizes)))
+    return ranges
+
+
+@contextmanager
+def _shard_files(outfile, count):
+    """Create count temporary shard files next to outfile, removed on exit."""
+    directory, name = os.path.split(os.path.abspath(outfile.name))
+    shard_files = []
+    try:
+        for _ in range(count):
+            fd, shard_filename = tempfile.mkstemp(prefix=f".{name}.", suffix=".shard", dir=directory)
+            os.close(fd)
+            shard_files.append(shard_filename)
+        yield shard_files
+    finally:
+        for shard_filename in shard_files:
+            try:
+                os.remove(shard_filename)
+            except OSError:
+                pass
+
+
+def _shard_args(files, start, stop, settings, previous):
+    """Return the render_shard arguments after the shard filename: only a shard's entries are materialised."""
+    entries = list(files.entries(start, stop))
+    shard_previous = previous.subset(entry[0] for entry in entries) if previous is not None else None
+    return entries, settings, shard_previous
+
+
+def _append_shard(outfile, shard_filename, result, log):
+    """Append a rendered shard to outfile and its SectionLog (if any) to log; return log."""
+    base = outfile.tell()
+    append_file(outfile, shard_filename)
+    if result is None:
+        return log
+    if log is None:
+        log = SectionLog()
+    log.extend(result.shifted(base))
+    return log
+
+
+def _render_in_pool(outfile, files, ranges, settings, previous, options):
+    """Render every range in a pool of settings.render_workers processes."""
+    log = None
+    with _shard_files(outfile, len(ranges)) as shard_files:
+        with ProcessPoolExecutor(max_workers=min(settings.render_workers, len(ranges)),
+                                 initializer=install_budget, initargs=(current_budget(),)) as executor:
+            futures = [executor.submit(render_shard, shard_filename,
+                                       *_shard_args(files, start, stop, settings, previous), **options)
+                       for shard_filename, (start, stop) in zip(shard_files, ranges)]
+            # Append each shard as soon as it and all shards before it are done
+            for shard_filename, future in zip(shard_files, futures):
+                log = _append_shard(outfile, shard_filename, future.result(), log)
+    return log
+
+
+def _render_with_idle_workers(outfile, files, ranges, settings, previous, options, idle_workers, helpers):
+    """
+    Render the ranges in this process from the front, while each idle worker
+    token acquired lets a helper process take a range from the back.
+    """
+    pending = deque(range(len(ranges)))
+    stolen = {}
+    results = {}
+    executor = None
+    log = None
+    with _shard_files(outfile, len(ranges)) as shard_files:
+        try:
+            while pending:
+                while len(pending) > 1 and idle_workers.acquire(block=False):
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=helpers, initializer=install_budget,
+                                                       initargs=(current_budget(),))
+                    index = pending.pop()
+                    start, stop = ranges[index]
+                    future = executor.submit(render_shard, shard_files[index],
+                                             *_shard_args(files, start, stop, settings, previous), **options)
+                    future.add_done_callback(lambda _future: idle_workers.release())
+                    stolen[index] = future
+                index = pending.popleft()
+                start, stop = ranges[index]
+                results[index] = render_shard(shard_files[index],
+                                              *_shard_args(files, start, stop, settings, previous), **options)
+            for index, shard_filename in enumerate(shard_files):
+                result = stolen[index].result() if index in stolen else results[index]
+                log = _append_shard(outfile, shard_filename, result, log)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    return log
+
+
+def needs_file_sizes(settings):
+    """Check if render_contents may shard, and so needs a FileManifest with sizes to weight the shards."""
+    return not settings.dedup_links and (settings.render_workers > 1 or _idle_workers is not None)
+
+
+def render_contents(outfile, files, settings, previous=None, **options):
+    """
+    Write the content sections of files (a FileManifest) to outfile.
+
+    Serially this is write_file_contents(outfile, files, settings, previous,
+    **options). With settings.render_workers > 1, render_shard renders
+    contiguous ranges of files in worker processes, with the same options
+    (which must therefore be picklable), and the shards are appended to
+    outfile in order. In a project worker of
+    run_projects, big projects are split the same way for the workers left
+    idle. Emitting linked files once depends on every earlier file, so
+    SCAN_DEDUP_LINKS keeps rendering serial.
+
+    Returns the SectionLog of the sections written when settings.incremental
+    is set, with offsets in outfile, else None.
+    """
+    if not needs_file_sizes(settings) or files.sizes is None:
+        return write_file_contents(outfile, files, settings, previous, **options)
+    sizes = files.sizes
+    if settings.render_workers > 1:
+        ranges = shard_ranges(sizes, settings.render_workers * SHARDS_PER_WORKER)
+        if len(ranges) > 1:
+            return _render_in_pool(outfile, files, ranges, settings, previous, options)
+    elif sum(sizes) >= STEAL_MIN_BYTES:
+        idle_workers, jobs = _idle_workers
+        ranges = shard_ranges(sizes, jobs * SHARDS_PER_WORKER)
+        if len(ranges) > 1:
+            return _render_with_idle_workers(outfile, files, ranges, settings, previous, options,
+                                             idle_workers, jobs - 1)
+    return write_file_contents(outfile, files, settings, previous, **options)
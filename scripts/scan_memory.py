@@ -0,0 +1,95 @@
+"""
+Global Memory Budget for the Project Summary Generators
+
+With projects, content shards and reader threads running concurrently, the
+buffers of every worker add up. A MemoryBudget is a byte count shared by all
+the processes of a run (SCAN_MEMORY_BUDGET): read-ahead buffers reserve from
+it and wait while it is exhausted, and output buffers shrink to what is left.
+
+Waiting only happens while other read-ahead reservations are outstanding.
+Those are always released by a writer that never waits while holding them,
+so the backpressure cannot deadlock; a request that cannot fit even with no
+read-ahead left proceeds anyway.
+"""
+
+import multiprocessing
+
+# Budget of the current process, installed by the scanners' main() and by
+# the initializer of every worker pool
+_budget = None
+
+
+def install_budget(budget):
+    """Make budget (or None for no limit) the memory budget of this process."""
+    global _budget
+    _budget = budget
+
+
+def current_budget():
+    """Return the memory budget of this process, or None when memory is not limited."""
+    return _budget
+
+
+class MemoryBudget:
+    """A byte budget shared by all the processes of a run, with usage statistics."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._condition = multiprocessing.Condition()
+        self._used = multiprocessing.RawValue('q', 0)
+        self._read_ahead = multiprocessing.RawValue('q', 0)
+        self._peak = multiprocessing.RawValue('q', 0)
+        self._waits = multiprocessing.RawValue('q', 0)
+
+    def _take(self, size):
+        self._used.value += size
+        if self._used.value > self._peak.value:
+            self._peak.value = self._used.value
+
+    def acquire(self, size, block=True):
+        """
+        Reserve size bytes of read-ahead, waiting while they do not fit.
+
+        With block=False, return False instead of waiting. A blocking call
+        must not be made while holding other read-ahead reservations.
+        """
+        with self._condition:
+            if self._used.value + size > self.limit and self._read_ahead.value > 0:
+                if not block:
+                    return False
+                self._waits.value += 1
+                while self._used.value + size > self.limit and self._read_ahead.value > 0:
+                    self._condition.wait()
+            self._take(size)
+            self._read_ahead.value += size
+        return True
+
+    def release(self, size):
+        """Return a read-ahead reservation."""
+        with self._condition:
+            self._used.value -= size
+            self._read_ahead.value -= size
+            self._condition.notify_all()
+
+    def acquire_up_to(self, size):
+        """Reserve up to size bytes without waiting; return the number reserved."""
+        with self._condition:
+            granted = max(0, min(size, self.limit - self._used.value))
+            self._take(granted)
+        return granted
+
+    def release_granted(self, size):
+        """Return a reservation made with acquire_up_to."""
+        with self._condition:
+            self._used.value -= size
+            self._condition.notify_all()
+
+    @property
+    def peak(self):
+        """Most bytes reserved at once so far."""
+        return self._peak.value
+
+    @property
+    def waits(self):
+        """Number of reservations that had to wait for memory."""
+        return self._waits.value
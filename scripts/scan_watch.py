@@ -0,0 +1,234 @@
+"""
+Watch Mode for the Project Summary Generators
+
+After the first run, --watch keeps the scanner running and regenerates the
+summary of a project when its files change. Change events come from inotify
+(bound with ctypes, no third-party package) on the directories a summary
+lists: the project root and every directory the walk descends into. Where
+inotify is unavailable, or with --poll-interval, the listings of those
+directories are polled instead.
+
+Bursts of events (an editor saving, a branch checkout) are debounced: a
+project is regenerated once no event has arrived for DEBOUNCE_SECONDS.
+Regeneration is incremental (SCAN_INCREMENTAL is on in watch mode), so only
+the sections of changed files are rendered again.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+
+from scan_jobs import run_projects
+
+DEBOUNCE_SECONDS = 0.5
+POLL_INTERVAL = 2.0
+
+# inotify event masks (<sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """A minimal inotify instance: directory watches and (wd, mask) events."""
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available in this C library") from None
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._add_watch.restype = ctypes.c_int
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+    def add_watch(self, path):
+        """Watch a directory; return its watch descriptor."""
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), path)
+        return wd
+
+    def read_events(self, timeout=None):
+        """Return the (wd, mask) of pending events, waiting up to timeout seconds (None: forever)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            events.append((wd, mask))
+            offset += _EVENT_HEADER.size + name_length
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def watched_directories(project_dir, records):
+    """Return the project root and the directories a walk (WalkEntry records) descends into."""
+    directories = [project_dir]
+    directories.extend(record.path for record in records if record.is_dir and record.descend)
+    return directories
+
+
+def _snapshot(directories):
+    """Digest the listings (names, sizes, mtimes) of directories, for polling."""
+    digest = hashlib.blake2b(digest_size=16)
+    for directory in directories:
+        digest.update(os.fsencode(directory) + b'\0')
+        try:
+            with os.scandir(directory) as listing:
+                entries = sorted(listing, key=lambda entry: entry.name)
+        except OSError:
+            digest.update(b'unreadable\n')
+            continue
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                line = f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\0{stat.st_ino}\n"
+            except OSError:
+                line = f"{entry.name}\0unreadable\n"
+            digest.update(line.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def _regenerate(process_project, projects, changed, jobs):
+    names = ', '.join(projects[i][0] for i in sorted(changed))
+    print(f"[{time.strftime('%H:%M:%S')}] Changes in: {names}")
+    run_projects(process_project, [projects[i] for i in sorted(changed)], jobs)
+    sys.stdout.flush()
+
+
+def _watch_inotify(inotify, process_project, projects, list_directories, debounce, jobs):
+    # Watch descriptor -> index of its project
+    watched = {}
+
+    def add_watches(index):
+        for directory in list_directories(projects[index][1][0]):
+            try:
+                watched[inotify.add_watch(directory)] = index
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise
+                # Removed since it was listed: the change is seen from its parent
+
+    for index in range(len(projects)):
+        add_watches(index)
+
+    while True:
+        changed = set()
+        events = inotify.read_events()
+        # Collect until the burst is over
+        while events:
+            for wd, mask in events:
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(range(len(projects)))
+                elif wd in watched:
+                    if not mask & IN_IGNORED:
+                        changed.add(watched[wd])
+                    else:
+                        del watched[wd]
+            events = inotify.read_events(debounce)
+        if changed:
+            _regenerate(process_project, projects, changed, jobs)
+            # New directories of the regenerated projects get watches too
+            for index in changed:
+                add_watches(index)
+
+
+def _watch_polling(process_project, projects, list_directories, debounce, poll_interval, jobs):
+    def snapshot(index):
+        return _snapshot(list_directories(projects[index][1][0]))
+
+    snapshots = [snapshot(index) for index in range(len(projects))]
+    while True:
+        time.sleep(poll_interval)
+        changed = {index for index in range(len(projects)) if snapshot(index) != snapshots[index]}
+        if not changed:
+            continue
+        # Wait for the changed projects to settle
+        while True:
+            current = {index: snapshot(index) for index in changed}
+            time.sleep(debounce)
+            if all(snapshot(index) == current[index] for index in changed):
+                break
+        for index in changed:
+            snapshots[index] = current[index]
+        _regenerate(process_project, projects, changed, jobs)
+
+
+def watch_projects(process_project, projects, list_directories, jobs=1, poll_interval=0.0,
+                   debounce=DEBOUNCE_SECONDS):
+    """
+    Regenerate the summaries of projects (run_projects (project_name, args)
+    pairs, args starting with project_dir) as their files change, until
+    interrupted. list_directories(project_dir) returns the directories to
+    watch. With poll_interval > 0, or without inotify, directory listings are
+    polled every poll_interval (or POLL_INTERVAL) seconds.
+    """
+    inotify = None
+    if poll_interval <= 0:
+        try:
+            inotify = Inotify()
+        except OSError as e:
+            print(f"Warning: inotify unavailable ({e}), polling for changes instead", file=sys.stderr)
+            poll_interval = POLL_INTERVAL
+
+    try:
+        if inotify is not None:
+            print(f"Watching {len(projects)} projects for changes (inotify); press Ctrl-C to stop")
+            sys.stdout.flush()
+            try:
+                _watch_inotify(inotify, process_project, projects, list_directories, debounce, jobs)
+            except OSError as e:
+                if e.errno != errno.ENOSPC:
+                    raise
+                print("Warning: out of inotify watches, polling for changes instead", file=sys.stderr)
+                poll_interval = POLL_INTERVAL
+        print(f"Watching {len(projects)} projects for changes (polling every {poll_interval:g}s); "
+              "press Ctrl-C to stop")
+        sys.stdout.flush()
+        _watch_polling(process_project, projects, list_directories, debounce, poll_interval, jobs)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        if inotify is not None:
+            inotify.close()
+    return 0